@@ -3,18 +3,23 @@ from ordereddict import OrderedDict
 import dexy.data
 import dexy.doc
 import dexy.exceptions
-import dexy.filter
+import dexy.fingerprints
 import dexy.metadata
-import inspect
+import dexy.storage
 import json
 import os
 import shutil
-import stat
 
 class Artifact(Task):
+    manifest_entry = None
+
     def setup(self):
         self.set_log()
-        self.metadata = dexy.metadata.Md5()
+        metadata_class = dexy.metadata.Metadata.aliases[self.runner.params.hashfunction]
+        if not metadata_class.is_active():
+            msg = "hash function %s is not available on this system"
+            raise dexy.exceptions.UserFeedback(msg % self.runner.params.hashfunction)
+        self.metadata = metadata_class()
         self.after_setup()
 
     def set_and_save_hash(self):
@@ -34,6 +39,35 @@ class Artifact(Task):
         self.hashstring = self.metadata.compute_hash()
         self.log.debug("hashstring for %s is %s" % (self.key, self.hashstring))
 
+    def manifest_info(self):
+        """
+        State to be stored in the run manifest so this artifact can be
+        restored without running it.
+        """
+        return {
+                'data_class' : self.output_data.ALIASES[0],
+                'ext' : self.ext,
+                'hashstring' : self.hashstring,
+                'name' : self.name
+                }
+
+    def load_manifest_entry(self):
+        """
+        Restores state from the run manifest if this artifact is unchanged
+        since the last run. Returns True if state was restored.
+        """
+        if not self.manifest_entry:
+            return False
+
+        self.hashstring = self.manifest_entry['hashstring']
+        self.ext = self.manifest_entry['ext']
+        self.name = self.manifest_entry['name']
+
+        data_class = dexy.data.Data.aliases[self.manifest_entry['data_class']]
+        self.output_data = data_class(self.hashstring, self.ext, self.runner)
+        self.log.debug("restored %s from run manifest" % self.key)
+        return True
+
     def parent_dir(self):
         return os.path.dirname(self.name)
 
@@ -53,12 +87,12 @@ class Artifact(Task):
         ]
 
     def tmp_dir(self):
-        return os.path.join(self.run_params.artifacts_dir, self.hashstring)
+        return dexy.storage.shard_path(self.runner.params.work_dir, self.hashstring, self.hashstring)
 
     def create_working_dir(self, populate=False):
         tmpdir = self.tmp_dir()
         shutil.rmtree(tmpdir, ignore_errors=True)
-        os.mkdir(tmpdir)
+        os.makedirs(tmpdir)
 
         if populate:
             for key, doc in self.runner.completed.iteritems():
@@ -85,10 +119,7 @@ class InitialArtifact(Artifact):
 
     def set_metadata_attrs(self):
         self.metadata.key = self.key
-
-        stat_info = os.stat(self.name)
-        self.metadata.mtime = stat_info[stat.ST_MTIME]
-        self.metadata.size = stat_info[stat.ST_SIZE]
+        self.metadata.contents_fingerprint = self.runner.stat_cache.fingerprint(self.name)
 
     def data_class_alias(self):
         return 'generic'
@@ -98,11 +129,14 @@ class InitialArtifact(Artifact):
         self.output_data = data_class(self.hashstring, self.ext, self.runner)
 
     def set_output_data(self):
-        self.output_data.copy_from_file(self.name)
+        self.output_data.copy_from_file(self.name, allow_links=False)
 
     def run(self, *args, **kw):
         self.set_log()
 
+        if self.load_manifest_entry():
+            return
+
         self.ext = os.path.splitext(self.name)[1]
 
         self.set_metadata_attrs()
@@ -144,6 +178,10 @@ class FilterArtifact(Artifact):
     def run(self, *args, **kw):
         self.input_data = self.prior.output_data
 
+        if self.load_manifest_entry():
+            self.source = 'cached'
+            return
+
         self.set_extension()
         self.set_name()
         self.set_metadata_hash()
@@ -152,6 +190,8 @@ class FilterArtifact(Artifact):
         if not self.output_data.is_cached():
             self.log.debug("Running filter %s" % self.filter_class.__name__)
             self.generate()
+            if not self.output_data.is_cached():
+                self.output_data.storage.index_data_file()
             self.source = 'generated'
         else:
             self.log.debug("Results of %s already cached" % (self.key))
@@ -174,30 +214,17 @@ class FilterArtifact(Artifact):
         self.metadata.next_filter_name = self.next_filter_name
         self.metadata.prior_hash = self.prior.hashstring
 
-        self.metadata.pre_method_source = inspect.getsource(self.pre)
-        self.metadata.post_method_source = inspect.getsource(self.post)
+        self.metadata.pre_method = dexy.fingerprints.method_fingerprint(self.pre)
+        self.metadata.post_method = dexy.fingerprints.method_fingerprint(self.post)
 
-        strargs = []
+        # Args are hashed as a structure, so dicts are hashed in key order
+        # whatever order their keys were added in.
         self.log.debug("args for %s are %s" % (self.key, self.args))
-        for k in sorted(self.args):
-            if not k in ['runner']:
-                v = str(self.args[k])
-                strargs.append("%s: %s" % (k, v))
-        self.metadata.argstr = ", ".join(strargs)
-
-        # Determines if Dexy itself has been updated or if the filter source
-        # code has changed.
-        self.metadata.dexy_version = dexy.__version__
-
-        sources = []
-        klass = self.filter_class
-        while klass != dexy.filter.Filter:
-            sources.append(dexy.filter.Filter.source[klass.__name__])
-            klass = klass.__base__
-        sources.append(dexy.filter.Filter.source[klass.__name__])
-        self.metadata.filter_source = "\n".join(sources)
-
-        # TODO add filter software version
+        self.metadata.args = dict((k, v) for k, v in self.args.iteritems() if not k in ['runner'])
+
+        # Determines if Dexy itself, the filter source code or the software
+        # run by the filter has changed.
+        self.metadata.filter = dexy.fingerprints.filter_fingerprint(self.filter_class)
 
         self.set_and_save_hash()
 
@@ -207,9 +234,7 @@ class FilterArtifact(Artifact):
         doc.runner = self.runner
         doc.setup()
 
-        for task in (doc,):
-            for t in task:
-                t()
+        self.runner.run_tasks(doc)
 
         self.doc.children.append(doc)
 
@@ -0,0 +1,116 @@
+from dexy.manifest import Manifest
+import dexy.storage
+import os
+import shutil
+
+class GarbageCollector(object):
+    """
+    Removes the records of old batches from the database, then removes
+    artifact files and working directories whose hashstrings aren't referred
+    to by any of the batches which are kept (mark and sweep), along with
+    temporary files left by interrupted writes.
+    """
+    SHARD_NAME = dexy.storage.SHARD_NAME
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.params = runner.params
+
+    def reserved_files(self):
+        """
+        Files in the artifacts directory which dexy uses for its own records.
+        """
+        db_file = self.params.db_file
+        filenames = [
+                db_file, "%s-wal" % db_file, "%s-shm" % db_file,
+                self.params.manifest_file,
+                self.params.stat_cache_file
+                ]
+        return set(os.path.abspath(f) for f in filenames if f)
+
+    def collect(self, batches=None, days=None):
+        """
+        Keeps the last `batches` batches and any batches started in the last
+        `days` days, returns a dict with the number of task records, files and
+        directories removed.
+        """
+        db = self.runner.db
+        removed = { 'tasks' : 0, 'files' : 0, 'dirs' : 0 }
+
+        oldest_batch_id = db.oldest_batch_id_to_keep(batches, days)
+        if oldest_batch_id is None:
+            return removed
+
+        removed['tasks'] = db.delete_batches_before(oldest_batch_id)
+        hashstrings = db.hashstrings_since_batch(oldest_batch_id)
+
+        self.sweep(hashstrings, removed)
+        self.prune_manifest(hashstrings)
+        self.prune_stat_cache()
+
+        db.vacuum()
+        return removed
+
+    def stored_paths(self, base_dir):
+        """
+        Yields the paths of entries in the shard subdirectories of base_dir,
+        and of entries directly in base_dir left by earlier versions of dexy.
+        """
+        if not os.path.isdir(base_dir):
+            return
+
+        for name in os.listdir(base_dir):
+            path = os.path.join(base_dir, name)
+            if not (self.SHARD_NAME.match(name) and os.path.isdir(path)):
+                yield path
+                continue
+
+            for subname in os.listdir(path):
+                subpath = os.path.join(path, subname)
+                if self.SHARD_NAME.match(subname) and os.path.isdir(subpath):
+                    for filename in os.listdir(subpath):
+                        yield os.path.join(subpath, filename)
+
+    def sweep(self, hashstrings, removed):
+        reserved = self.reserved_files()
+
+        for base_dir in (self.params.artifacts_dir, self.params.work_dir):
+            for filepath in self.stored_paths(base_dir):
+                filename = os.path.basename(filepath)
+                if filename.startswith(dexy.storage.TEMP_PREFIX) and os.path.isfile(filepath):
+                    os.remove(filepath)
+                    removed['files'] += 1
+                    continue
+
+                m = dexy.storage.ARTIFACT_NAME.match(filename)
+                if not m or m.group(1) in hashstrings or os.path.abspath(filepath) in reserved:
+                    continue
+
+                if os.path.isdir(filepath):
+                    shutil.rmtree(filepath)
+                    removed['dirs'] += 1
+                else:
+                    os.remove(filepath)
+                    self.runner.store_index.discard(filepath)
+                    removed['files'] += 1
+
+    def prune_manifest(self, hashstrings):
+        """
+        Removes docs from the manifest if any of their artifacts were removed.
+        """
+        manifest = Manifest(self.runner)
+        for key, entry in manifest.entries.items():
+            if not all(a['hashstring'] in hashstrings for a in entry['artifacts']):
+                del manifest.entries[key]
+        manifest.save()
+
+    def prune_stat_cache(self):
+        """
+        Removes stat cache entries for source files which no longer exist.
+        """
+        stat_cache = self.runner.stat_cache
+        stat_cache.load()
+        for filepath in stat_cache.entries.keys():
+            if not os.path.exists(filepath):
+                del stat_cache.entries[filepath]
+        stat_cache.save()
@@ -1,6 +1,8 @@
 from dexy.params import RunParams
 from modargs import args
 import dexy.exceptions
+import dexy.runner
+import dexy.storage
 import os
 import sys
 import warnings
@@ -60,17 +62,22 @@ def dexy_command(
         dryrun=False, # if True, just parse config and print batch info, don't run dexy
         exclude="", # directories to exclude from dexy processing
         filters=False, # DEPRECATED just to catch people who use the old dexy --filters syntax
+        gcbatches=DEFAULT_PARAMS.gc_batches, # after running, remove artifacts not used in this many recent batches, 0 means never
+        gcdays=DEFAULT_PARAMS.gc_days, # after running, remove artifacts not used in batches from this many recent days, 0 means never
         globals="", # global values to make available within dexy documents, should be KEY=VALUE pairs separated by spaces
         help=False, # for people who type -help out of habit
         h=False, # for people who type -h out of habit
-        hashfunction='md5', # What hash function to use, set to crc32 or adler32 for more speed, less reliability
+        hashfunction=DEFAULT_PARAMS.hashfunction, # What hash function to use, md5, sha1 or blake2b, set to crc32 or adler32 for more speed, less reliability
         ignore=False, # whether to ignore nonzero exit status or raise an error - may not be supported by all filters
         inputs=False, # whether to log information about inputs for debugging
+        j=DEFAULT_PARAMS.workers, # shortcut for --workers
         logfile=DEFAULT_PARAMS.log_file, # name of log file
         loglevel=DEFAULT_PARAMS.log_level, # default log level (see Constants.LOGLEVELS.keys), can also be set per-document
         logsdir=DEFAULT_PARAMS.log_dir, # location of directory in which to store logs
+        materialize=DEFAULT_PARAMS.materialize, # how to put cached files in place, one of copy, hardlink, reflink or symlink, links are faster and use less disk space
         nocache=False, # whether to force artifacts to run even if there is a matching file in the cache
         output=False, # Shortcut to mean "I just want the OutputReporter, nothing else"
+        processes=DEFAULT_PARAMS.processes, # number of worker processes for CPU-bound filters such as pyg and markdown, 1 means don't use worker processes
         recurse=True, # whether to recurse into subdirectories when running Dexy
         reporters=False, # DEPRECATED just to catch people who use the old dexy --reporters syntax
         reports=DEFAULT_PARAMS.reports, # reports to be run after dexy runs, enclose in quotes and separate with spaces
@@ -80,7 +87,8 @@ def dexy_command(
         silent=False, # Whether to not print any output when running dexy
         strictinherit=False, # set to true if you want 'allinputs' to only reference items in same dir or a subdir
         uselocals=True, # use cached local copies of remote URLs, faster but might not be up to date, 304 from server will override this setting
-        version=False # DEPRECATED just to catch people who use the old dexy --version syntax
+        version=False, # DEPRECATED just to catch people who use the old dexy --version syntax
+        workers=DEFAULT_PARAMS.workers # number of tasks to run in parallel, independent documents are run at the same time
     ):
     """
     Runs Dexy, by processing your .dexy configuration file and running content
@@ -135,6 +143,9 @@ def dexy_command(
         if not reports == DEFAULT_PARAMS.reports:
             raise dexy.exceptions.UserFeedback("if you pass --allreports you can't also specify --reports")
 
+    if j != DEFAULT_PARAMS.workers:
+        workers = int(j)
+
     controller = run_dexy(locals())
     if not dryrun:
         if allreports:
@@ -166,6 +177,52 @@ def run_dexy(args):
     controller.run()
     return controller
 
+def artifacts_dir_params(artifactsdir, **kwargs):
+    """
+    Returns RunParams for artifactsdir, with the working directory, manifest
+    and stat cache in artifactsdir as they are in the default artifacts dir.
+    """
+    def in_artifacts_dir(default_path):
+        return os.path.join(artifactsdir, os.path.relpath(default_path, DEFAULT_PARAMS.artifacts_dir))
+
+    return RunParams(
+            artifacts_dir=artifactsdir,
+            manifest_file=in_artifacts_dir(DEFAULT_PARAMS.manifest_file),
+            stat_cache_file=in_artifacts_dir(DEFAULT_PARAMS.stat_cache_file),
+            work_dir=in_artifacts_dir(DEFAULT_PARAMS.work_dir),
+            **kwargs)
+
+def gc_command(
+        artifactsdir=DEFAULT_PARAMS.artifacts_dir, # location of directory in which artifacts are stored
+        batches=5, # number of recent batches whose artifacts should be kept
+        days=0, # also keep artifacts from batches run in this many recent days
+        dbfile=DEFAULT_PARAMS.db_file # name of the database file
+    ):
+    """
+    Removes cached artifacts, working directories and database records which
+    aren't used by recent batches, then compacts the database.
+    """
+    if not os.path.exists(artifactsdir):
+        raise dexy.exceptions.UserFeedback("no artifacts directory found at '%s'" % artifactsdir)
+
+    params = artifacts_dir_params(artifactsdir, db_file=dbfile)
+    removed = dexy.runner.Runner(params).collect_garbage(int(batches), int(days))
+    print "removed %(tasks)s task records, %(files)s files and %(dirs)s directories" % removed
+
+def migrate_command(
+        artifactsdir=DEFAULT_PARAMS.artifacts_dir, # location of directory in which artifacts are stored
+        workdir=DEFAULT_PARAMS.work_dir # location of directory in which working directories are stored
+    ):
+    """
+    Moves cached artifacts and working directories created by earlier
+    versions of dexy into the subdirectories where dexy now looks for them.
+    """
+    if not os.path.exists(artifactsdir):
+        raise dexy.exceptions.UserFeedback("no artifacts directory found at '%s'" % artifactsdir)
+
+    n = dexy.storage.migrate_flat_layout(artifactsdir, workdir)
+    print "moved %s artifacts and working directories" % n
+
 def check_setup(logsdir=DEFAULT_PARAMS.log_dir, artifactsdir=DEFAULT_PARAMS.artifacts_dir):
     return os.path.exists(logsdir) and os.path.exists(artifactsdir)
 
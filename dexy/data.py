@@ -1,6 +1,9 @@
+from contextlib import closing
 from dexy.plugin import PluginMeta
+from ordereddict import OrderedDict
+import StringIO
 import dexy.storage
-import shutil
+import os
 
 class Data:
     ALIASES = []
@@ -11,18 +14,20 @@ class Data:
 
 class GenericData(Data):
     ALIASES = ['generic']
+    CHUNK_SIZE = 65536
     DEFAULT_STORAGE_TYPE = 'generic'
 
     """
     Data in a single lump, which may be binary or text-based.
     """
     def __init__(self, hashstring, ext, runner, storage_type=None):
-        if not storage_type:
-            storage_type = self.DEFAULT_STORAGE_TYPE
-
         if not runner.__class__.__name__ == "Runner":
             raise Exception
 
+        if not storage_type:
+            storage_types = runner.params.storage_types
+            storage_type = storage_types.get(self.ALIASES[0], self.DEFAULT_STORAGE_TYPE)
+
         self.hashstring = hashstring
         self.ext = ext
         self.runner = runner
@@ -48,9 +53,60 @@ class GenericData(Data):
         self._data = data
         self.save()
 
+    def set_data_from_stream(self, stream):
+        """
+        Persist data to disk from an iterator, without holding all the data
+        in memory.
+        """
+        self._data = None
+        self.storage.write_stream(stream)
+
     def load_data(self):
         self._data = self.storage.read_data()
 
+    def open(self):
+        """
+        Returns a file-like object from which data can be read.
+        """
+        return self.storage.open_data()
+
+    def buffer(self):
+        """
+        Returns the data as a read-only object which supports len(), slicing
+        and find(). Data files larger than the mmap_threshold param are
+        memory-mapped rather than read into memory.
+        """
+        if self._data is None and self.storage.data_size() > self.runner.params.mmap_threshold:
+            return self.storage.map_data()
+        else:
+            return self.data()
+
+    def view(self):
+        """
+        Returns a read-only view of the data for use in templates, which
+        avoids loading data into memory where possible.
+        """
+        if self._data is None and self.storage.data_size() > self.runner.params.mmap_threshold:
+            return MappedText(self)
+        else:
+            return self.data()
+
+    def iter_chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.CHUNK_SIZE
+        with closing(self.open()) as f:
+            chunk = f.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = f.read(chunk_size)
+
+    def iter_lines(self):
+        """
+        Yields each line of the data, including line endings.
+        """
+        with closing(self.open()) as f:
+            for line in f:
+                yield line
+
     def has_data(self):
         return self._data or self.storage.data_file_exists()
 
@@ -58,7 +114,7 @@ class GenericData(Data):
         return self.storage.data_file_exists()
 
     def data(self):
-        if not self._data:
+        if self._data is None:
             self.load_data()
         return self._data
 
@@ -68,8 +124,25 @@ class GenericData(Data):
     def as_sectioned(self):
         return {'1' : self.data()}
 
-    def copy_from_file(self, filename):
-        shutil.copyfile(filename, self.storage.data_file())
+    def copy_from_file(self, filename, allow_links=True):
+        """
+        Stores the contents of filename. Set allow_links to False if filename
+        may be modified later, so the stored data can't change with it.
+        """
+        strategy = self.runner.params.materialize
+        if not allow_links and strategy in ('hardlink', 'symlink'):
+            strategy = 'reflink'
+        self.storage.copy_from_file(filename, strategy)
+
+    def copy_from_data(self, data):
+        """
+        Stores the contents of another data object.
+        """
+        filepath = data.storage.data_path()
+        if data.storage.__class__ == self.storage.__class__ and os.path.exists(filepath):
+            self.copy_from_file(filepath)
+        else:
+            self.set_data_from_stream(data.iter_chunks())
 
     def clear_data(self):
         self._data = None
@@ -78,11 +151,144 @@ class GenericData(Data):
         """
         Write canonical output to a file. Parent directory must exist already.
         """
-        self.storage.write_data(self._data, filepath)
+        if self.storage.data_file_exists():
+            # Storage copies or links the data file, so don't load the data.
+            data = self._data
+        else:
+            data = self.data()
+        self.storage.write_data(data, filepath)
+
+class MappedText(object):
+    """
+    Read-only string view of a large data file. len(), slicing, find() and
+    rfind() use a memory map of the file, which is returned by buffer(). Other
+    string methods and str() read the whole text.
+    """
+    def __init__(self, data):
+        self._data = data
+        self._map = None
+
+    def buffer(self):
+        if self._map is None:
+            self._map = self._data.storage.map_data()
+        return self._map
+
+    def __str__(self):
+        return self.buffer()[:]
+
+    def __unicode__(self):
+        return unicode(str(self))
+
+    def __len__(self):
+        return len(self.buffer())
+
+    def __getitem__(self, key):
+        return self.buffer()[key]
+
+    def __iter__(self):
+        return iter(self.buffer())
+
+    def __contains__(self, text):
+        return self.buffer().find(text) > -1
+
+    def __eq__(self, other):
+        return str(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __add__(self, other):
+        return str(self) + other
+
+    def __radd__(self, other):
+        return other + str(self)
+
+    def find(self, *args):
+        return self.buffer().find(*args)
+
+    def rfind(self, *args):
+        return self.buffer().rfind(*args)
+
+    def __getattr__(self, name):
+        # Check the name first so looking up other attributes, e.g. hasattr
+        # checks, doesn't read the whole file.
+        if not hasattr(str, name):
+            raise AttributeError(name)
+        return getattr(str(self), name)
+
+class LazySections(object):
+    """
+    Read-only mapping of the sections of a SectionedData object. Keys are
+    read from the index, each section is read the first time it is accessed.
+    """
+    def __init__(self, data):
+        self._data = data
+        self._keys = None
+        self._sections = {}
+
+    def keys(self):
+        if self._keys is None:
+            self._keys = self._data.section_keys()
+        return list(self._keys)
+
+    def __getitem__(self, key):
+        if not key in self._sections:
+            self._sections[key] = self._data.section(key)
+        return self._sections[key]
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def has_key(self, key):
+        return key in self
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        else:
+            return default
+
+    def iteritems(self):
+        for k in self.keys():
+            yield k, self[k]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return [self[k] for k in self.keys()]
+
+class LazyKeyValues(LazySections):
+    """
+    Read-only mapping of the pairs in a KeyValueData object, each value is
+    looked up the first time it is accessed.
+    """
+    def keys(self):
+        if self._keys is None:
+            self._keys = self._data.keys()
+        return list(self._keys)
+
+    def __getitem__(self, key):
+        if not key in self._sections:
+            self._sections[key] = self._data.value(key)
+        return self._sections[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
 
 class SectionedData(GenericData):
     ALIASES = ['sectioned']
-    DEFAULT_STORAGE_TYPE = 'jsonordered'
+    DEFAULT_STORAGE_TYPE = 'sections'
 
     def as_text(self):
         return "\n".join(v for v in self.data().values())
@@ -90,6 +296,31 @@ class SectionedData(GenericData):
     def as_sectioned(self):
         return self.data()
 
+    def section(self, key):
+        """
+        Returns the contents of the named section, reading only that section
+        if the data isn't loaded already.
+        """
+        if self._data is None:
+            return self.storage.read_section(key)
+        else:
+            return self._data[key]
+
+    def section_keys(self):
+        if self._data is None:
+            return self.storage.read_keys()
+        else:
+            return self._data.keys()
+
+    def view(self):
+        return LazySections(self)
+
+    def open(self):
+        return StringIO.StringIO(self.as_text())
+
+    def buffer(self):
+        return self.as_text()
+
     def output_to_file(self, filepath):
         """
         Write canonical output to a file.
@@ -106,12 +337,65 @@ class KeyValueData(GenericData):
 
     def as_text(self):
         text = []
-        for k, v in self._data.iteritems():
+        for k, v in self.data().iteritems():
             text.append("%s: %s" % (k, v))
         return "\n".join(text)
 
+    def open(self):
+        return StringIO.StringIO(self.as_text())
+
+    def buffer(self):
+        return self.as_text()
+
+    def output_to_file(self, filepath):
+        """
+        Write canonical output to a file. Parent directory must exist already.
+        """
+        self.storage.write_data(self.data(), filepath)
+
+    def data(self):
+        # _data starts as an empty dict to which values can be appended.
+        if not self._data:
+            self.load_data()
+        return self._data
+
+    def is_lazy(self):
+        """
+        Whether values are looked up in storage rather than loaded together.
+        """
+        return not self._data and self.storage.KEY_LOOKUPS
+
+    def view(self):
+        if self.is_lazy():
+            return LazyKeyValues(self)
+        else:
+            return self.data()
+
     def append(self, key, value):
         self._data[key] = value
 
     def keys(self):
-        return self._data.keys()
+        if self.is_lazy():
+            return self.storage.read_keys()
+        else:
+            return self.data().keys()
+
+    def value(self, key):
+        """
+        Returns the value stored under key.
+        """
+        if self.is_lazy():
+            return self.storage.read_value(key)
+        else:
+            return self.data()[key]
+
+    def query(self, prefix):
+        """
+        Returns an OrderedDict of the pairs whose keys start with prefix,
+        sorted by key.
+        """
+        if self.is_lazy():
+            return self.storage.read_prefix(prefix)
+        else:
+            data = self.data()
+            return OrderedDict((k, data[k]) for k in sorted(data) if k.startswith(prefix))
@@ -1,6 +1,9 @@
 from datetime import datetime
+from datetime import timedelta
 from dexy.plugin import PluginMeta
+from ordereddict import OrderedDict
 import json
+import time
 
 class Database:
     """
@@ -14,9 +17,16 @@ class Database:
         return True
 
 import sqlite3
+import threading
 class Sqlite3(Database):
+    """
+    Task records are buffered and written in batches, committing every
+    FLUSH_SIZE records or FLUSH_INTERVAL seconds, whichever comes first.
+    """
     START_BATCH_ID = 1001
     ALIASES = ['sqlite3', 'sqlite']
+    FLUSH_SIZE = 1000
+    FLUSH_INTERVAL = 5
     FIELDS = [
             ("unique_key", "text"),
             ("batch_id" , "integer"),
@@ -29,26 +39,99 @@ class Sqlite3(Database):
             ("started_at", "timestamp"),
             ("completed_at", "timestamp"),
             ]
+    INDEXES = ["batch_id", "created_by_doc", "hashstring", "unique_key"]
 
-    def get_child_hashes_in_previous_batch(self, current_batch_id, parent_hashstring):
-        sql = "select max(batch_id) as previous_batch_id from tasks where batch_id < ?"
-        self.cursor.execute(sql, (current_batch_id,))
-        row = self.cursor.fetchone()
-        previous_batch_id = row['previous_batch_id']
+    def load_previous_batch(self, current_batch_id):
+        """
+        Loads all tasks in the batch before current_batch_id which were
+        created by other docs, keyed by the hashstring of the creating doc.
+        """
+        with self.lock:
+            sql = "select max(batch_id) as previous_batch_id from tasks where batch_id < ?"
+            self.cursor.execute(sql, (current_batch_id,))
+            row = self.cursor.fetchone()
+            previous_batch_id = row['previous_batch_id']
+
+            sql = "select * from tasks where batch_id = ? and created_by_doc is not null order by doc_key, started_at"
+            self.cursor.execute(sql, (previous_batch_id,))
+
+            children = {}
+            for row in self.cursor.fetchall():
+                children.setdefault(row['created_by_doc'], []).append(row)
 
-        sql = "select * from tasks where batch_id = ? and created_by_doc = ? order by doc_key, started_at"
-        self.cursor.execute(sql, (previous_batch_id, parent_hashstring))
-        return self.cursor.fetchall()
+            self.previous_batch = (current_batch_id, children)
+
+    def get_child_hashes_in_previous_batch(self, current_batch_id, parent_hashstring):
+        with self.lock:
+            if not self.previous_batch or self.previous_batch[0] != current_batch_id:
+                self.load_previous_batch(current_batch_id)
+            return self.previous_batch[1].get(parent_hashstring, [])
 
     def get_next_batch_id(self):
         sql = "select max(batch_id) as max_batch_id from tasks"
-        self.cursor.execute(sql)
-        row = self.cursor.fetchone()
+        with self.lock:
+            self.cursor.execute(sql)
+            row = self.cursor.fetchone()
         if row['max_batch_id']:
             return row['max_batch_id'] + 1
         else:
             return self.START_BATCH_ID
 
+    def oldest_batch_id_to_keep(self, batches=None, days=None):
+        """
+        Returns the id of the oldest batch which is either one of the last
+        `batches` batches or was started within the last `days` days. The
+        latest batch is always kept. Returns None if there are no batches.
+        """
+        with self.lock:
+            self.flush()
+
+            self.cursor.execute("select max(batch_id) as batch_id from tasks")
+            oldest = self.cursor.fetchone()['batch_id']
+            if oldest is None:
+                return None
+
+            if batches:
+                sql = "select distinct batch_id from tasks order by batch_id desc limit 1 offset ?"
+                self.cursor.execute(sql, (batches - 1,))
+                row = self.cursor.fetchone()
+                if row:
+                    oldest = min(oldest, row['batch_id'])
+                else:
+                    oldest = self.START_BATCH_ID
+
+            if days:
+                cutoff = datetime.now() - timedelta(days=days)
+                sql = "select min(batch_id) as batch_id from tasks where started_at >= ?"
+                self.cursor.execute(sql, (cutoff,))
+                row = self.cursor.fetchone()
+                if row['batch_id']:
+                    oldest = min(oldest, row['batch_id'])
+
+        return oldest
+
+    def hashstrings_since_batch(self, batch_id):
+        sql = "select distinct hashstring from tasks where batch_id >= ? and hashstring is not null"
+        with self.lock:
+            self.cursor.execute(sql, (batch_id,))
+            return set(row['hashstring'] for row in self.cursor.fetchall())
+
+    def delete_batches_before(self, batch_id):
+        """
+        Deletes records of all batches older than batch_id, returns the number
+        of records deleted.
+        """
+        with self.lock:
+            self.flush()
+            self.cursor.execute("delete from tasks where batch_id < ?", (batch_id,))
+            self.conn.commit()
+            return self.cursor.rowcount
+
+    def vacuum(self):
+        with self.lock:
+            self.flush()
+            self.conn.execute("vacuum")
+
     def add_task_before_running(self, task):
         if hasattr(task, 'doc'):
             doc_key = task.doc.key
@@ -86,17 +169,68 @@ class Sqlite3(Database):
 
     def __init__(self, runner):
         self.runner = runner
+        # Tasks may be run from worker threads, so share the connection
+        # between threads and serialize access to it.
+        self.lock = threading.RLock()
         self.conn = sqlite3.connect(
                 self.runner.params.db_file,
-                detect_types=sqlite3.PARSE_DECLTYPES
+                detect_types=sqlite3.PARSE_DECLTYPES,
+                check_same_thread=False
                 )
         self.conn.row_factory = sqlite3.Row
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
         self.cursor = self.conn.cursor()
         self.create_table()
 
+        self.previous_batch = None
+
+        # Statements are built once, sqlite3 caches the compiled statement.
+        self.insert_sql = self.create_insert_sql()
+        self.pending_inserts = OrderedDict()
+        self.pending_updates = []
+        self.last_flush = time.time()
+
     def save(self):
-        self.conn.commit()
-        self.conn.close()
+        with self.lock:
+            self.flush()
+            self.conn.close()
+
+    def create_insert_sql(self):
+        keys = [k for k, t in self.FIELDS]
+        qs = ("?," * len(keys))[:-1]
+        return "insert into tasks (%s) VALUES (%s)" % (",".join(keys), qs)
+
+    def flush(self):
+        """
+        Writes all buffered task records to the database in one transaction.
+        """
+        with self.lock:
+            if self.pending_inserts:
+                keys = [k for k, t in self.FIELDS]
+                rows = [[attrs.get(k) for k in keys] for attrs in self.pending_inserts.values()]
+                self.conn.executemany(self.insert_sql, rows)
+
+            updates = OrderedDict()
+            for unique_key, attrs in self.pending_updates:
+                keys = tuple(sorted(attrs))
+                values = [attrs[k] for k in keys]
+                values.append(unique_key)
+                updates.setdefault(keys, []).append(values)
+
+            for keys, rows in updates.iteritems():
+                sql = "update tasks set %s WHERE unique_key=?" % ", ".join("%s=?" % k for k in keys)
+                self.conn.executemany(sql, rows)
+
+            self.conn.commit()
+            self.pending_inserts = OrderedDict()
+            self.pending_updates = []
+            self.last_flush = time.time()
+
+    def flush_if_due(self):
+        n = len(self.pending_inserts) + len(self.pending_updates)
+        if n >= self.FLUSH_SIZE or (time.time() - self.last_flush) > self.FLUSH_INTERVAL:
+            self.flush()
 
     def create_table_sql(self):
         sql = "create table tasks (%s)"
@@ -110,21 +244,28 @@ class Sqlite3(Database):
         except sqlite3.OperationalError as e:
             if e.message != "table tasks already exists":
                 raise e
+        self.create_indexes()
 
-    def create_record(self, attrs):
-        keys = sorted(attrs)
-        values = [attrs[k] for k in keys]
+    def create_indexes(self):
+        """
+        Creates any indexes missing from the tasks table, which includes all
+        indexes for databases created by earlier versions of dexy.
+        """
+        for field in self.INDEXES:
+            sql = "create index if not exists tasks_%s on tasks (%s)"
+            self.conn.execute(sql % (field, field))
+        self.conn.commit()
 
-        qs = ("?," * len(keys))[:-1]
-        sql = "insert into tasks (%s) VALUES (%s)" % (",".join(keys), qs)
-        self.conn.execute(sql, values)
+    def create_record(self, attrs):
+        with self.lock:
+            self.pending_inserts[attrs['unique_key']] = attrs
+            self.flush_if_due()
 
     def update_record(self, unique_key, attrs):
-        keys = sorted(attrs)
-        values = [attrs[k] for k in keys]
-        updates = ["%s=?" % k for k in keys]
-
-        sql = "update tasks set %s WHERE unique_key=?" % ", ".join(updates)
-        values.append(unique_key)
-
-        self.conn.execute(sql, values)
+        with self.lock:
+            if self.pending_inserts.has_key(unique_key):
+                # Not written yet, so write the updated values in the insert.
+                self.pending_inserts[unique_key].update(attrs)
+            else:
+                self.pending_updates.append((unique_key, attrs))
+            self.flush_if_due()
@@ -0,0 +1,68 @@
+from ordereddict import OrderedDict
+import sys
+import threading
+
+def estimate_size(value):
+    """
+    Returns the approximate number of bytes taken up by value.
+    """
+    if isinstance(value, basestring):
+        return len(value)
+    elif isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.iteritems())
+    else:
+        return sys.getsizeof(value)
+
+class DataCache(object):
+    """
+    Data loaded from storage during a run, shared by all data objects and
+    limited to max_bytes in total. The least recently used data is evicted
+    first. Dicts are returned as shallow copies, so changing the data returned
+    doesn't change the cache.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def copy(self, value):
+        if isinstance(value, dict):
+            return value.__class__(value)
+        else:
+            return value
+
+    def get(self, key, load):
+        """
+        Returns the data cached under key, calling load to load the data if
+        it isn't in the cache.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                value, size = self.entries.pop(key)
+                self.entries[key] = (value, size)
+                return self.copy(value)
+            self.misses += 1
+
+        value = load()
+        self.add(key, value)
+        return self.copy(value)
+
+    def add(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+            self.entries[key] = (value, size)
+            self.size += size
+
+            while self.size > self.max_bytes:
+                evicted_key, (evicted_value, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
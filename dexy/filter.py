@@ -1,7 +1,9 @@
+import StringIO
 import dexy.plugin
 import dexy.utils
 import dexy.doc
 import dexy.exceptions
+import logging
 import os
 import platform
 import subprocess
@@ -9,6 +11,57 @@ import subprocess
 class FilterException(Exception):
     pass
 
+# Software versions reported by each filter class's version command.
+VERSIONS = {}
+
+class ArtifactSummary(object):
+    """
+    Picklable stand-in for an artifact, passed to process-safe filters when
+    their process methods run in a worker process. Only the filter's own args
+    are included.
+    """
+    def __init__(self, artifact, include_prior=True):
+        self.key = artifact.key
+        self.name = artifact.name
+        self.ext = artifact.ext
+        self._web_safe_document_key = artifact.web_safe_document_key()
+
+        if hasattr(artifact, 'filter_alias'):
+            self.filter_alias = artifact.filter_alias
+            self.args = { self.filter_alias : artifact.filter_args() }
+        else:
+            self.filter_alias = None
+            self.args = {}
+
+        if include_prior and artifact.prior:
+            self.prior = ArtifactSummary(artifact.prior, False)
+        else:
+            self.prior = None
+
+    def web_safe_document_key(self):
+        return self._web_safe_document_key
+
+    def filter_args(self):
+        return self.args.get(self.filter_alias, {})
+
+def run_process_method(filter_alias, method_name, input_data, artifact_summary):
+    """
+    Runs a process method of a filter in a worker process. Returns the output
+    along with any log messages, which should be passed on to the artifact's
+    log.
+    """
+    filter_instance = Filter.aliases[filter_alias]()
+    filter_instance.artifact = artifact_summary
+
+    logstream = StringIO.StringIO()
+    filter_instance.log = logging.getLogger("dexy.process.%s" % artifact_summary.key)
+    filter_instance.log.propagate = False
+    filter_instance.log.setLevel(logging.DEBUG)
+    filter_instance.log.handlers = [logging.StreamHandler(logstream)]
+
+    output = getattr(filter_instance, method_name)(input_data)
+    return output, logstream.getvalue()
+
 class Filter:
     """
     This is the main DexyFilter class. To make custom filters you should
@@ -23,6 +76,7 @@ class Filter:
     INPUT_EXTENSIONS = [".*"]
     OUTPUT_EXTENSIONS = [".*"]
     OUTPUT_DATA_TYPE = 'generic'
+    PROCESS_SAFE = False # Whether process_text etc. can run in a worker process.
     TAGS = [] # Descriptive keywords about the filter.
     VERSION_COMMAND = None
     WINDOWS_VERSION_COMMAND = None
@@ -59,6 +113,15 @@ class Filter:
     def output_filepath(self):
         return self.artifact.output_data.storage.data_file()
 
+    def open_output_file(self):
+        """
+        Opens the output data file for filters which write to it directly,
+        use in a with statement. The output data file only exists once the
+        with block completes, so an interrupted filter leaves no partial
+        output to be mistaken for cached data.
+        """
+        return self.artifact.output_data.storage.open_for_writing()
+
     @classmethod
     def executables(self):
         """
@@ -117,6 +180,16 @@ class Filter:
         else:
             return None
 
+    @classmethod
+    def cached_version(klass):
+        """
+        Returns the output of version(), running the version command only
+        once per process.
+        """
+        if not VERSIONS.has_key(klass):
+            VERSIONS[klass] = klass.version()
+        return VERSIONS[klass]
+
     @classmethod
     def output_file_extension(klass, ext, key, next_input_extensions=None):
         out_ext = None
@@ -149,6 +222,14 @@ class Filter:
         """Allow filters to be disabled."""
         return True
 
+    def is_process_safe(self):
+        """
+        Whether the process_text, process_dict or process_text_to_dict method
+        of this filter only depends on its input, the filter args and the
+        attributes of ArtifactSummary, so it can be run in a worker process.
+        """
+        return self.PROCESS_SAFE
+
     def find_closest_parent(self, param_name):
         self.log.debug("In find_closest_parent for %s" % self.artifact.key)
         inputs = self.artifact.inputs()
@@ -228,34 +309,58 @@ class Filter:
         if not self.artifact.input_data.has_data():
             raise Exception("no data!")
 
-        if hasattr(self, "process_text_to_dict"):
+        if hasattr(self, "process_stream"):
+            output = self.process_stream(self.artifact.input_data.iter_lines())
+            self.artifact.output_data.set_data_from_stream(output)
+
+            method_used = "process_stream"
+
+        elif hasattr(self, "process_text_to_dict"):
             if not self.artifact.output_data.__class__.__name__ == "SectionedData":
                 raise dexy.exceptions.InternalDexyProblem("filter implementing a process_text_to_dict method must specify OUTPUT_DATA_TYPE = 'sectioned'")
 
-            output = self.process_text_to_dict(self.artifact.input_data.as_text())
+            output = self.call_process_method("process_text_to_dict", self.artifact.input_data.as_text())
             self.artifact.output_data.set_data(output)
 
             method_used = "process_text_to_dict"
 
         elif hasattr(self, "process_dict"):
-            output = self.process_dict(self.artifact.input_data.as_sectioned())
+            output = self.call_process_method("process_dict", self.artifact.input_data.as_sectioned())
             self.artifact.output_data.set_data(output)
 
             method_used = "process_dict"
 
         elif hasattr(self, "process_text"):
-            output = self.process_text(self.artifact.input_data.as_text())
+            output = self.call_process_method("process_text", self.artifact.input_data.as_text())
             self.artifact.output_data.set_data(output)
 
             method_used = "process_text"
 
         else:
-            self.artifact.output_data.copy_from_file(self.artifact.input_data.storage.data_file())
+            self.artifact.output_data.copy_from_data(self.artifact.input_data)
 
             method_used = "process"
 
         self.log.debug("Used method %s of default process method." % method_used)
         return method_used
 
+    def call_process_method(self, method_name, input_data):
+        """
+        Calls the named process method on input_data, in a worker process if
+        the runner has a process pool and this filter is process-safe.
+        """
+        pool = self.artifact.runner.process_pool
+
+        if pool and self.is_process_safe():
+            self.log.debug("Running %s in a worker process" % method_name)
+            summary = ArtifactSummary(self.artifact)
+            args = (self.artifact.filter_alias, method_name, input_data, summary)
+            output, log_text = pool.apply(run_process_method, args)
+            for line in log_text.splitlines():
+                self.log.debug(line)
+            return output
+        else:
+            return getattr(self, method_name)(input_data)
+
 class DexyFilter(Filter):
     ALIASES = ['dexy']
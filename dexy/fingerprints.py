@@ -0,0 +1,41 @@
+"""
+Per-process registry of digests for filter classes and task methods, so their
+source code is only looked up and hashed once per process rather than once
+per artifact.
+"""
+import dexy
+import dexy.filter
+import hashlib
+import inspect
+
+FILTERS = {}
+METHODS = {}
+
+def filter_fingerprint(filter_class):
+    """
+    Returns a digest of the source of filter_class and its parent classes,
+    the dexy version and the version of any software the filter runs.
+    """
+    if not filter_class in FILTERS:
+        parts = [dexy.__version__, str(filter_class.cached_version())]
+
+        klass = filter_class
+        while klass != dexy.filter.Filter:
+            parts.append(dexy.filter.Filter.source[klass.__name__])
+            klass = klass.__base__
+        parts.append(dexy.filter.Filter.source[klass.__name__])
+
+        FILTERS[filter_class] = hashlib.md5("\n".join(parts)).hexdigest()
+
+    return FILTERS[filter_class]
+
+def method_fingerprint(method):
+    """
+    Returns a digest of the source of a function or method.
+    """
+    code = getattr(method, 'im_func', method).func_code
+
+    if not code in METHODS:
+        METHODS[code] = hashlib.md5(inspect.getsource(method)).hexdigest()
+
+    return METHODS[code]
@@ -0,0 +1,115 @@
+import dexy.exceptions
+
+VISITING = 1
+VISITED = 2
+
+def run_task(task, *args, **kw):
+    """
+    Runs task after running all of its children, in the same order as
+    iterating over and calling each task would, but using an explicit stack
+    instead of recursion so deep dependency chains can be run.
+    """
+    if not start_task(task, *args, **kw):
+        return
+
+    stack = [[task, 0]]
+    while stack:
+        frame = stack[-1]
+        parent, i = frame
+
+        if i < len(parent.children):
+            child = parent.children[i]
+            if child.state == 'complete':
+                parent.add_completed_child(child)
+                frame[1] += 1
+            else:
+                start_task(child, *args, **kw)
+                stack.append([child, 0])
+        else:
+            parent.execute(*args, **kw)
+            parent.post(*args, **kw)
+            parent.transition('complete')
+            parent.runner.release_tracker.completed(parent)
+            stack.pop()
+
+def start_task(task, *args, **kw):
+    """
+    Moves task into the running state and runs its pre method. Returns False
+    if the task has already been completed.
+    """
+    if task.state == 'setup':
+        task.transition('running')
+        task.pre(*args, **kw)
+        return True
+    elif task.state == 'running':
+        raise dexy.exceptions.CircularDependency(task.key)
+    elif task.state == 'complete':
+        return False
+    else:
+        raise dexy.exceptions.UnexpectedState("%s in %s" % (task.state, task.key))
+
+class TaskGraph(object):
+    """
+    The graph of all tasks reachable from a set of root tasks, with an edge
+    from each task to each of its children.
+    """
+    def __init__(self, *roots):
+        self.roots = list(roots)
+        self.tasks = []
+        self.edges = {}
+        self.build()
+
+    def build(self):
+        stack = list(reversed(self.roots))
+        while stack:
+            task = stack.pop()
+            if task in self.edges:
+                continue
+
+            self.tasks.append(task)
+            self.edges[task] = list(task.children)
+            stack.extend(reversed(task.children))
+
+    def sort(self):
+        """
+        Returns all tasks in the graph ordered so that each task comes after
+        all of its children. Raises CircularDependency, naming the tasks which
+        form the cycle, if there is no such order.
+        """
+        if hasattr(self, 'sorted_tasks'):
+            return self.sorted_tasks
+
+        ordered = []
+        marks = {}
+
+        for root in self.roots:
+            if root in marks:
+                continue
+
+            marks[root] = VISITING
+            stack = [(root, iter(self.edges[root]))]
+
+            while stack:
+                task, children = stack[-1]
+                for child in children:
+                    mark = marks.get(child)
+                    if mark is None:
+                        marks[child] = VISITING
+                        stack.append((child, iter(self.edges[child])))
+                        break
+                    elif mark == VISITING:
+                        path = [t for t, c in stack]
+                        cycle = path[path.index(child):] + [child]
+                        msg = " -> ".join(t.key for t in cycle)
+                        raise dexy.exceptions.CircularDependency(msg)
+                else:
+                    marks[task] = VISITED
+                    ordered.append(task)
+                    stack.pop()
+
+        self.sorted_tasks = ordered
+        return ordered
+
+    def run(self, *args, **kw):
+        for task in self.roots:
+            run_task(task, *args, **kw)
@@ -6,19 +6,44 @@ Data storage is typically intended to be write-once, read-one-or-more-times.
 Intended to help with Python scripts and to serve as templates for implementing
 similar helpers in other languages, or alternate Python implementations.
 """
+from dexy.storage import prefix_range
+from ordereddict import OrderedDict
+import array
 import csv
+import dexy.data
 import dexy.exceptions
 import json
+import mmap
 import os
+import sys
+
+def quote_identifier(name):
+    return '"%s"' % name.replace('"', '""')
+
+def csv_string(value):
+    """
+    Returns value as the csv module writes it.
+    """
+    if value is None:
+        return ""
+    elif isinstance(value, float):
+        return repr(value)
+    else:
+        return "%s" % value
 
 class DataStorage(object):
     """
     Parent class for RowData and KeyValueData.
     """
+    # Rows written to sqlite3 files are buffered and inserted this many at a
+    # time, all in a single transaction which is committed by save().
+    SQLITE3_BUFFER_SIZE = 10000
+
     def __init__(self, filename, headers=None):
         self.filename = filename
         self.ext = os.path.splitext(filename)[1]
         self.headers = headers
+        self._buffer = []
 
         if os.path.exists(self.filename):
             self.init_read()
@@ -34,6 +59,11 @@ class DataStorage(object):
             if self.headers:
                 self._writer.writerow(self.headers)
 
+        elif self.ext == ".jsonl":
+            self._data_file = open(self.filename, "wb")
+            if self.headers:
+                self._data_file.write("%s\n" % json.dumps(self.headers))
+
         elif self.ext == ".json":
             self._storage = {}
 
@@ -53,7 +83,7 @@ class DataStorage(object):
     def init_read(self):
         self.mode = "read"
 
-        if self.ext == ".csv":
+        if self.ext in (".csv", ".jsonl"):
             self._file = open(self.filename, "rb")
         elif self.ext == ".json":
             with open(self.filename, "rb") as f:
@@ -63,14 +93,38 @@ class DataStorage(object):
             self._storage = DB()
             self._storage.open(self.filename, DB.OREADER)
         elif self.ext == ".sqlite3":
-            import sqlite3
-            self._storage = sqlite3.connect(self.filename)
-            self._cursor = self._storage.cursor()
+            self.init_read_sqlite3()
         else:
             raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
 
+    def init_read_sqlite3(self):
+        import sqlite3
+        self._storage = sqlite3.connect(self.filename)
+        self._cursor = self._storage.cursor()
+
+    def init_write_sqlite3(self):
+        import sqlite3
+        self._storage = sqlite3.connect(self.filename)
+        self._storage.execute("PRAGMA journal_mode=WAL")
+        self._storage.execute("PRAGMA synchronous=NORMAL")
+        self._cursor = self._storage.cursor()
+        self.create_sqlite3_table()
+
+    def append_sqlite3(self, row):
+        self._buffer.append(row)
+        if len(self._buffer) >= self.SQLITE3_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Inserts buffered rows into a sqlite3 file.
+        """
+        if self.ext == ".sqlite3" and self._buffer:
+            self._cursor.executemany(self.sqlite3_insert_sql(), self._buffer)
+            self._buffer = []
+
     def save(self):
-        if self.ext == ".csv":
+        if self.ext in (".csv", ".jsonl"):
             self._data_file.close()
         elif self.ext == ".json":
             with open(self.filename, "wb") as f:
@@ -80,17 +134,38 @@ class DataStorage(object):
             if not self._storage.close():
                 raise dexy.exceptions.UserFeedback(self._storage.error())
         elif self.ext == ".sqlite3":
+            self.flush()
             self._storage.commit()
             self._cursor.close()
+            # WAL is only used while writing, switching back checkpoints the
+            # data into the main file so it can be copied on its own.
+            self._storage.execute("PRAGMA journal_mode=DELETE")
+            self._storage.close()
         else:
             raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
 
 class RowData(DataStorage):
-    def init_write_sqlite3(self):
-        import sqlite3
-        self._storage = sqlite3.connect(self.filename)
-        self._cursor = self._storage.cursor()
-        # TODO need to define fields based on headers
+    """
+    Rows of data with a header row. In sqlite3 files the headers are the
+    column names of the 'rowdata' table and values keep their types, as they
+    do in jsonl files, which hold one JSON list per row. Headers are required
+    to write sqlite3 and jsonl files. A csv file written without headers has
+    no header row, so to read its columns and rows pass the headers to
+    RowData when reading it.
+    """
+    EXTENSIONS = [".csv", ".jsonl", ".sqlite3"]
+
+    def init_write(self):
+        if self.ext in (".jsonl", ".sqlite3") and not self.headers:
+            raise dexy.exceptions.UserFeedback("Headers are needed to write %s" % self.filename)
+        DataStorage.init_write(self)
+
+    def create_sqlite3_table(self):
+        columns = ", ".join(quote_identifier(h) for h in self.headers)
+        self._cursor.execute("CREATE TABLE rowdata (%s)" % columns)
+
+    def sqlite3_insert_sql(self):
+        return "INSERT INTO rowdata VALUES (%s)" % ", ".join("?" for h in self.headers)
 
     def append(self, *rowdata):
         if not self.mode == "write":
@@ -98,6 +173,10 @@ class RowData(DataStorage):
 
         if self.ext == ".csv":
             self._writer.writerow(rowdata)
+        elif self.ext == ".jsonl":
+            self._data_file.write("%s\n" % json.dumps(rowdata))
+        elif self.ext == ".sqlite3":
+            self.append_sqlite3(rowdata)
         else:
             raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
 
@@ -108,19 +187,123 @@ class RowData(DataStorage):
         if not self.mode == "read":
             raise dexy.exceptions.UserFeedback("Trying to read but in '%s' mode!" % self.mode)
 
-        if self.ext == ".csv":
+        if self.ext in (".csv", ".jsonl"):
             return self._file.read()
         else:
             raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
 
+    def file_rows(self):
+        """
+        Yields each row of a csv or jsonl file as a list, the headers first.
+        """
+        with open(self.filename, "rb") as f:
+            if self.ext == ".csv":
+                for row in csv.reader(f):
+                    yield row
+            else:
+                for line in f:
+                    yield json.loads(line)
+
+    def file_headers(self, file_rows):
+        """
+        Returns the headers passed to RowData for a csv file without a header
+        row, otherwise reads them from the first row of file_rows.
+        """
+        if self.ext == ".csv" and self.headers:
+            return list(self.headers)
+
+        headers = next(file_rows, None)
+        if not headers:
+            raise dexy.exceptions.UserFeedback("No headers in %s" % self.filename)
+        return headers
+
+    def columns(self):
+        """
+        Returns the headers of the file.
+        """
+        if self.ext == ".sqlite3":
+            return [row[1] for row in self._storage.execute("PRAGMA table_info(rowdata)")]
+        else:
+            return self.file_headers(self.file_rows())
+
+    def rows(self, columns=None, where=None):
+        """
+        Returns an iterator over the rows of the file as tuples, excluding
+        the headers. If columns is given, only the values of those columns
+        are included. If where is given, a dict of column names and values,
+        only rows with those values are included. In sqlite3 files this is
+        done by the query, so rows are read from disk one at a time. Values in
+        csv files are strings, so where values are converted to strings as the
+        csv module writes them before comparing, e.g. 1.5 matches "1.5".
+        """
+        if not self.mode == "read":
+            raise dexy.exceptions.UserFeedback("Trying to read but in '%s' mode!" % self.mode)
+
+        where = where or {}
+        if self.ext == ".sqlite3":
+            return self.sqlite3_rows(columns, where)
+        elif self.ext in (".csv", ".jsonl"):
+            return self.filtered_file_rows(columns, where)
+        else:
+            raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
+
+    def sqlite3_rows(self, columns, where):
+        if columns:
+            sql = "SELECT %s FROM rowdata" % ", ".join(quote_identifier(c) for c in columns)
+        else:
+            sql = "SELECT * FROM rowdata"
+
+        conditions = where.items()
+        if conditions:
+            sql += " WHERE %s" % " AND ".join("%s = ?" % quote_identifier(k) for k, v in conditions)
+
+        for row in self._storage.cursor().execute(sql, [v for k, v in conditions]):
+            yield row
+
+    def filtered_file_rows(self, columns, where):
+        file_rows = self.file_rows()
+        headers = self.file_headers(file_rows)
+
+        def column_index(name):
+            if not name in headers:
+                raise dexy.exceptions.UserFeedback("No column '%s' in %s" % (name, self.filename))
+            return headers.index(name)
+
+        indexes = [column_index(c) for c in columns or headers]
+        conditions = [(column_index(k), v) for k, v in where.iteritems()]
+        if self.ext == ".csv":
+            conditions = [(i, csv_string(v)) for i, v in conditions]
+
+        for row in file_rows:
+            if all(row[i] == v for i, v in conditions):
+                yield tuple(row[i] for i in indexes)
+
 class KeyValueData(DataStorage):
     EXTENSIONS = [".json", ".sqlite3", ".kch"]
 
-    def init_write_sqlite3(self):
-        import sqlite3
-        self._storage = sqlite3.connect(self.filename)
-        self._cursor = self._storage.cursor()
+    def create_sqlite3_table(self):
         self._cursor.execute("CREATE TABLE kvstore (key TEXT, value TEXT)")
+        self._cursor.execute("CREATE UNIQUE INDEX kvstore_key ON kvstore (key)")
+
+    def sqlite3_insert_sql(self):
+        return "INSERT OR REPLACE INTO kvstore VALUES (?, ?)"
+
+    def init_read_sqlite3(self):
+        DataStorage.init_read_sqlite3(self)
+        self.migrate_sqlite3()
+
+    def migrate_sqlite3(self):
+        """
+        Indexes the keys of files written by earlier versions of dexy, which
+        didn't. Keys aren't unique in these files, so the index isn't either.
+        Read-only files are left unindexed.
+        """
+        import sqlite3
+        try:
+            self._cursor.execute("CREATE INDEX IF NOT EXISTS kvstore_key ON kvstore (key)")
+            self._storage.commit()
+        except sqlite3.OperationalError:
+            pass
 
     def append(self, key, value):
         if self.ext == ".json":
@@ -129,7 +312,7 @@ class KeyValueData(DataStorage):
             if not self._storage.set(key, value):
                 raise dexy.exceptions.UserFeedback("Error setting key %s in kyotocabinet: %s" % (key, self._storage.error()))
         elif self.ext == ".sqlite3":
-            self._cursor.execute("INSERT INTO kvstore VALUES (?, ?)", (str(key), str(value)))
+            self.append_sqlite3((str(key), str(value)))
         else:
             raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
 
@@ -186,6 +369,10 @@ class KeyValueData(DataStorage):
             raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
 
     def query(self, query_string):
+        """
+        Returns keys matching query_string, a LIKE pattern in sqlite3 files.
+        Use query_prefix to find keys by prefix, which is faster.
+        """
         if not self.mode == "read":
             raise dexy.exceptions.UserFeedback("Trying to read but in '%s' mode!" % self.mode)
 
@@ -196,3 +383,215 @@ class KeyValueData(DataStorage):
             return [k for k in self.keys() if query_string in k]
         else:
             raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
+
+    def query_prefix(self, prefix):
+        """
+        Returns a list of the (key, value) pairs whose keys start with prefix,
+        sorted by key. Uses the key index in sqlite3 files.
+        """
+        if not self.mode == "read":
+            raise dexy.exceptions.UserFeedback("Trying to read but in '%s' mode!" % self.mode)
+
+        if self.ext == ".sqlite3":
+            if prefix:
+                sql = "SELECT key, value from kvstore WHERE key >= ? AND key < ? ORDER BY key"
+                self._cursor.execute(sql, prefix_range(unicode(prefix)))
+            else:
+                self._cursor.execute("SELECT key, value from kvstore ORDER BY key")
+            return [(str(k), v) for k, v in self._cursor]
+        elif self.ext == ".json":
+            return [(k, self._storage[k]) for k in sorted(self.keys()) if k.startswith(prefix)]
+        elif self.ext == ".kch":
+            return [(k, self._storage.get(k)) for k in sorted(self._storage.match_prefix(prefix))]
+        else:
+            raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
+
+# Columns of numbers are stored as binary arrays in the machine's byte order,
+# each starting at a multiple of COLUMNS_ALIGNMENT bytes, followed by an
+# index of the columns and a trailer holding the offset of the index.
+COLUMNS_MAGIC = "dexy-columns 1\n"
+COLUMNS_ALIGNMENT = 64
+COLUMNS_TRAILER_FORMAT = "%020d\n"
+COLUMNS_TRAILER_LENGTH = 21
+
+class ColumnView(object):
+    """
+    Read-only sequence of the values in one column of a Columns object.
+    Values are read from the underlying string or memory map when they are
+    used, a slice at a time.
+    """
+    CHUNK_SIZE = 65536
+
+    def __init__(self, buf, typecode, itemsize, offset, length, swap):
+        if array.array(typecode).itemsize != itemsize:
+            msg = "Values of type '%s' are %s bytes here, but were written as %s bytes"
+            raise dexy.exceptions.UserFeedback(msg % (typecode, array.array(typecode).itemsize, itemsize))
+
+        self.buf = buf
+        self.typecode = typecode
+        self.itemsize = itemsize
+        self.offset = offset
+        self.length = length
+        self.swap = swap
+
+    def read(self, start, stop):
+        """
+        Returns an array of the values from start up to stop.
+        """
+        values = array.array(self.typecode)
+        values.fromstring(self.buf[self.offset + start * self.itemsize:self.offset + stop * self.itemsize])
+        if self.swap:
+            values.byteswap()
+        return values
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.length)
+            if step == 1:
+                return self.read(start, max(start, stop))
+            else:
+                return self.read(0, self.length)[i]
+
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError("column index out of range")
+        return self.read(i, i + 1)[0]
+
+    def __iter__(self):
+        for start in xrange(0, self.length, self.CHUNK_SIZE):
+            for value in self.read(start, min(start + self.CHUNK_SIZE, self.length)):
+                yield value
+
+    def array(self):
+        return self.read(0, self.length)
+
+    def numpy(self):
+        """
+        Returns a read-only numpy array of the column which shares memory
+        with the underlying string or memory map. Requires numpy.
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise dexy.exceptions.UserFeedback("numpy must be installed to get numpy arrays of columns")
+
+        dtype = numpy.dtype(self.typecode)
+        if self.swap:
+            dtype = dtype.newbyteorder()
+        return numpy.frombuffer(self.buf, dtype, self.length, self.offset)
+
+class Columns(object):
+    """
+    Read-only mapping of column names to ColumnView objects for data written
+    by ColumnData, which may be a string or a memory map, e.g. the buffer()
+    of a data object. A MappedText view, as templates get for large inputs,
+    is replaced by its memory map.
+    """
+    def __init__(self, buf):
+        if isinstance(buf, dexy.data.MappedText):
+            buf = buf.buffer()
+
+        if buf[0:len(COLUMNS_MAGIC)] != COLUMNS_MAGIC:
+            raise dexy.exceptions.UserFeedback("Data doesn't contain columns written by ColumnData.")
+
+        end = len(buf) - COLUMNS_TRAILER_LENGTH
+        index = json.loads(buf[int(buf[end:len(buf)]):end])
+        swap = index['byteorder'] != sys.byteorder
+
+        self.columns = OrderedDict()
+        for name, typecode, itemsize, offset, length in index['columns']:
+            self.columns[name] = ColumnView(buf, str(typecode), itemsize, offset, length, swap)
+
+    def keys(self):
+        return self.columns.keys()
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+class ColumnData(DataStorage):
+    """
+    Columns of numbers stored as binary arrays, which can be read without
+    parsing text and without copying them if the file is memory-mapped.
+    typecodes are array module typecodes, one per header, 'd' by default.
+    """
+    EXTENSIONS = [".columns"]
+
+    def __init__(self, filename, headers=None, typecodes=None):
+        self.typecodes = typecodes
+        DataStorage.__init__(self, filename, headers)
+
+    def init_write(self):
+        self.mode = "write"
+
+        if not self.ext in self.EXTENSIONS:
+            raise dexy.exceptions.UserFeedback("unsupported extension %s" % self.ext)
+        if not self.headers:
+            raise dexy.exceptions.UserFeedback("Headers are needed to name the columns in %s" % self.filename)
+
+        typecodes = self.typecodes or ['d'] * len(self.headers)
+        self._columns = OrderedDict((h, array.array(t)) for h, t in zip(self.headers, typecodes))
+
+    def init_read(self):
+        self.mode = "read"
+
+        with open(self.filename, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._columns = Columns(self._map)
+
+    def append(self, *values):
+        """
+        Appends a row, with one value for each column.
+        """
+        if not self.mode == "write":
+            raise dexy.exceptions.UserFeedback("Trying to write but in %s mode!" % self.mode)
+        if len(values) != len(self._columns):
+            raise dexy.exceptions.UserFeedback("Expected %s values, got %s" % (len(self._columns), len(values)))
+
+        for column, value in zip(self._columns.itervalues(), values):
+            column.append(value)
+
+    def extend(self, name, values):
+        """
+        Appends values, an iterable or array, to the named column.
+        """
+        if not self.mode == "write":
+            raise dexy.exceptions.UserFeedback("Trying to write but in %s mode!" % self.mode)
+        self._columns[name].extend(values)
+
+    def save(self):
+        with open(self.filename, "wb") as f:
+            f.write(COLUMNS_MAGIC)
+
+            index = []
+            for name, column in self._columns.iteritems():
+                f.write("\0" * (-f.tell() % COLUMNS_ALIGNMENT))
+                index.append((name, column.typecode, column.itemsize, f.tell(), len(column)))
+                column.tofile(f)
+
+            index_offset = f.tell()
+            f.write("%s\n" % json.dumps({ 'byteorder' : sys.byteorder, 'columns' : index }))
+            f.write(COLUMNS_TRAILER_FORMAT % index_offset)
+
+    def columns(self):
+        return self._columns.keys()
+
+    def column(self, name):
+        """
+        Returns a ColumnView of the named column, backed by a memory map.
+        """
+        if not self.mode == "read":
+            raise dexy.exceptions.UserFeedback("Trying to read but in '%s' mode!" % self.mode)
+        return self._columns[name]
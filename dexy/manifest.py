@@ -0,0 +1,130 @@
+from dexy.artifact import Artifact
+from dexy.artifact import InitialVirtualArtifact
+from dexy.doc import Doc
+import dexy
+import dexy.data
+import dexy.fingerprints
+import dexy.storage
+import hashlib
+import json
+import os
+
+def json_default(obj):
+    """
+    Serializes doc args which json can't handle. Functions and methods are
+    represented by a digest of their source, since their repr contains a
+    memory address which changes between runs.
+    """
+    if hasattr(getattr(obj, 'im_func', obj), 'func_code'):
+        return dexy.fingerprints.method_fingerprint(obj)
+    else:
+        return repr(obj)
+
+class Manifest(object):
+    """
+    Persisted record of the docs completed in the last run. Each doc is stored
+    with a digest of its config, the stat info of its source file and the
+    digests of its child docs, along with the state of each of its artifacts.
+
+    Docs whose digest is unchanged in the next run restore their artifacts
+    from the manifest rather than stat'ing, hashing and running them.
+    """
+    def __init__(self, runner):
+        self.runner = runner
+        self.filename = runner.params.manifest_file
+        self.digests = {}
+        self.load()
+
+    def load(self):
+        if self.filename and os.path.exists(self.filename):
+            with open(self.filename, "rb") as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {}
+
+    def save(self):
+        if self.filename:
+            with dexy.storage.atomic_write(self.filename) as f:
+                json.dump(self.entries, f)
+
+    def doc_digest(self, doc):
+        """
+        Returns a digest of everything which determines the output of doc, or
+        None if doc can't be restored from the manifest.
+        """
+        parts = [dexy.__version__, self.runner.params.hashfunction, doc.key]
+
+        args = doc.args.copy()
+        if args.has_key('runner'):
+            del args['runner']
+        parts.append(json.dumps(args, sort_keys=True, default=json_default))
+
+        for child in doc.children:
+            if isinstance(child, Doc):
+                child_digest = self.digests.get(child)
+                if not child_digest:
+                    return None
+                parts.append(child_digest)
+            elif not isinstance(child, Artifact):
+                return None
+
+        if not isinstance(doc.artifacts[0], InitialVirtualArtifact):
+            stat_info = os.stat(doc.name)
+            parts.append("%r %s" % (stat_info.st_mtime, stat_info.st_size))
+
+        for artifact in doc.artifacts[1:]:
+            parts.append(dexy.fingerprints.filter_fingerprint(artifact.filter_class))
+
+        return hashlib.md5("\n".join(parts)).hexdigest()
+
+    def restore(self, graph):
+        """
+        Sets manifest entries on the artifacts of each doc in the graph which
+        is unchanged since the last run. Returns the number of docs restored.
+        """
+        n = 0
+        for task in graph.sort():
+            if isinstance(task, Doc) and task.state == 'setup':
+                digest = self.doc_digest(task)
+                self.digests[task] = digest
+
+                entry = self.entries.get(task.key)
+                if digest and entry and entry['digest'] == digest:
+                    if self.restore_doc(task, entry):
+                        n += 1
+                    else:
+                        self.digests[task] = None
+        return n
+
+    def restore_doc(self, doc, entry):
+        artifact_entries = entry['artifacts']
+        if len(artifact_entries) != len(doc.artifacts):
+            return False
+
+        for artifact_entry in artifact_entries:
+            data_class = dexy.data.Data.aliases[artifact_entry['data_class']]
+            data = data_class(artifact_entry['hashstring'], artifact_entry['ext'], self.runner)
+            if not data.is_cached():
+                return False
+
+        for artifact, artifact_entry in zip(doc.artifacts, artifact_entries):
+            artifact.manifest_entry = artifact_entry
+        return True
+
+    def update(self, graph):
+        """
+        Records all docs in the graph which completed and didn't add any
+        additional docs while running.
+        """
+        for task in graph.tasks:
+            if isinstance(task, Doc) and task.state == 'complete':
+                digest = self.digests.get(task)
+                added_docs = [c for c in task.children if isinstance(c, Doc) and c.created_by_doc]
+
+                if digest and not added_docs:
+                    self.entries[task.key] = {
+                            'digest' : digest,
+                            'artifacts' : [a.manifest_info() for a in task.artifacts]
+                            }
+                elif self.entries.has_key(task.key):
+                    del self.entries[task.key]
@@ -1,7 +1,59 @@
 from dexy.plugin import PluginMeta
 from ordereddict import OrderedDict
 import hashlib
-import sqlite3
+import zlib
+
+try:
+    from hashlib import blake2b
+except ImportError:
+    try:
+        from pyblake2 import blake2b
+    except ImportError:
+        blake2b = None
+
+def canonical_chunks(value):
+    """
+    Yields a serialization of value which only depends on its contents, so
+    dicts are serialized in key order whatever order they were created in.
+    OrderedDict keeps its own order. Each item is tagged with its type and
+    strings with their length so different values can't serialize the same.
+    """
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+
+    if isinstance(value, str):
+        yield "s%s:" % len(value)
+        yield value
+    elif value is None:
+        yield "n"
+    elif isinstance(value, bool):
+        yield "b%d" % value
+    elif isinstance(value, (int, long)):
+        yield "i%d;" % value
+    elif isinstance(value, float):
+        yield "f%r;" % value
+    elif isinstance(value, (list, tuple)):
+        yield "l"
+        for item in value:
+            for chunk in canonical_chunks(item):
+                yield chunk
+        yield "e"
+    elif isinstance(value, dict):
+        if isinstance(value, OrderedDict):
+            yield "o"
+            keys = value.keys()
+        else:
+            yield "d"
+            keys = sorted(value)
+        for k in keys:
+            for chunk in canonical_chunks(k):
+                yield chunk
+            for chunk in canonical_chunks(value[k]):
+                yield chunk
+        yield "e"
+    else:
+        for chunk in canonical_chunks(repr(value)):
+            yield chunk
 
 class Metadata:
     ALIASES = []
@@ -11,18 +63,88 @@ class Metadata:
     def is_active(klass):
         return True
 
-    def get_string_for_hash(self):
-        ordered = OrderedDict()
+    def canonical_chunks(self):
+        """
+        Yields the serialization of all metadata fields, in field name order.
+        """
         for k in sorted(self.__dict__):
-            ordered[k] = str(self.__dict__[k])
+            for chunk in canonical_chunks(k):
+                yield chunk
+            for chunk in canonical_chunks(self.__dict__[k]):
+                yield chunk
+
+    def get_string_for_hash(self):
+        return "".join(self.canonical_chunks())
 
-        return str(ordered)
+    def hash_object(self):
+        """
+        Returns a new object with update and hexdigest methods, like those
+        provided by hashlib.
+        """
+        raise NotImplementedError()
+
+    def compute_hash(self):
+        h = self.hash_object()
+        for chunk in self.canonical_chunks():
+            h.update(chunk)
+        return h.hexdigest()
 
 class Md5(Metadata):
     """
     Class that stores metadata for a task. Uses md5 to calculate hash.
     """
     ALIASES = ['md5']
-    def compute_hash(self):
-        text = self.get_string_for_hash()
-        return hashlib.md5(text).hexdigest()
+    def hash_object(self):
+        return hashlib.md5()
+
+class Sha1(Metadata):
+    """
+    Uses sha1 to calculate hash.
+    """
+    ALIASES = ['sha1']
+    def hash_object(self):
+        return hashlib.sha1()
+
+class Blake2b(Metadata):
+    """
+    Uses blake2b to calculate hash, with a 16 byte digest. Requires Python 3.6
+    or the pyblake2 package.
+    """
+    ALIASES = ['blake2b']
+
+    @classmethod
+    def is_active(klass):
+        return blake2b is not None
+
+    def hash_object(self):
+        return blake2b(digest_size=16)
+
+class Checksum(object):
+    """
+    Wraps a zlib checksum function so it can be used like a hashlib object.
+    """
+    def __init__(self, checksum_function):
+        self.checksum_function = checksum_function
+        self.value = checksum_function("")
+
+    def update(self, data):
+        self.value = self.checksum_function(data, self.value)
+
+    def hexdigest(self):
+        return "%08x" % (self.value & 0xffffffff)
+
+class Crc32(Metadata):
+    """
+    Uses crc32 to calculate hash. Faster but less reliable than md5.
+    """
+    ALIASES = ['crc32']
+    def hash_object(self):
+        return Checksum(zlib.crc32)
+
+class Adler32(Metadata):
+    """
+    Uses adler32 to calculate hash. Faster but less reliable than md5.
+    """
+    ALIASES = ['adler32']
+    def hash_object(self):
+        return Checksum(zlib.adler32)
@@ -7,15 +7,30 @@ class RunParams(object):
     def __init__(self, **kwargs):
         # Default Values
         self.artifacts_dir = 'artifacts'
+        self.compress_extensions = ['.css', '.csv', '.htm', '.html', '.js', '.json', '.md', '.svg', '.tex', '.txt', '.xml'] # extensions of data stored gzip-compressed by compressed storage
+        self.compress_min_size = 1024 # data smaller than this many bytes isn't compressed by compressed storage
         self.config_file = '.dexy'
+        self.data_cache_size = 64 * 1024 * 1024 # max bytes of loaded data to keep in memory for reuse during a run
         self.db_alias = 'sqlite3'
         self.db_file = os.path.join(self.artifacts_dir, 'dexy.sqlite3')
+        self.gc_batches = 0 # if > 0, remove artifacts not used in this many recent batches after each run
+        self.gc_days = 0 # if > 0, remove artifacts not used in batches from this many recent days after each run
+        self.hashfunction = 'md5' # alias of Metadata class used to calculate hashstrings
         self.log_dir = 'logs'
         self.log_file = 'dexy.log'
         self.log_path = os.path.join(self.log_dir, self.log_file)
         self.log_level = 'DEBUG'
         self.log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        self.manifest_file = os.path.join(self.artifacts_dir, 'dexy-manifest.json') # set to None to always check every doc
+        self.materialize = 'copy' # how to put cached files in place, one of copy, hardlink, reflink or symlink
+        self.memory_ceiling = 0 # if > 0, release output data early to keep no more than this many bytes in memory
+        self.mmap_threshold = 16 * 1024 * 1024 # data files larger than this many bytes are memory-mapped when used as buffers
+        self.processes = 1 # number of processes for running process-safe filters, 1 means run in-process
         self.reports = ['output']
+        self.stat_cache_file = os.path.join(self.artifacts_dir, 'dexy-statcache.json')
+        self.storage_types = {} # storage alias to use for each data type, e.g. {'generic' : 'compressed'}
+        self.work_dir = os.path.join(self.artifacts_dir, 'work')
+        self.workers = 1 # number of tasks to run at once, 1 means run serially
 
         for key, value in kwargs.iteritems():
             if not hasattr(self, key):
@@ -15,8 +15,9 @@ class UnprocessedDirectoryArchiveFilter(Filter):
         subdir = self.args()['dir']
         dir_to_archive = os.path.join(parent_dir, subdir)
         af = self.output_filepath()
-        with tarfile.open(af, mode="w:gz") as tar:
-            for fn in os.listdir(dir_to_archive):
-                fp = os.path.join(dir_to_archive, fn)
-                self.log.debug("Adding file %s to archive %s" % (fp, af))
-                tar.add(fp, arcname=os.path.join(subdir, fn))
+        with self.open_output_file() as f:
+            with tarfile.open(mode="w:gz", fileobj=f) as tar:
+                for fn in os.listdir(dir_to_archive):
+                    fp = os.path.join(dir_to_archive, fn)
+                    self.log.debug("Adding file %s to archive %s" % (fp, af))
+                    tar.add(fp, arcname=os.path.join(subdir, fn))
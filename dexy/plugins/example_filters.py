@@ -110,7 +110,7 @@ class ExampleProcessMethodManualWrite(Filter):
     def process(self):
         input_data = self.artifact.input_data.data()
         output = "Dexy processed the text '%s'" % input_data
-        with open(self.artifact.output_data.storage.data_file(), "wb") as f:
+        with self.open_output_file() as f:
             f.write(output)
 
 class ExampleProcessWithDictMethod(Filter):
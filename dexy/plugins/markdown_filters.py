@@ -15,11 +15,20 @@ class MarkdownFilter(Filter):
     OUTPUT_EXTENSIONS = ['.html']
     ALIASES = ['markdown']
     DEFAULT_EXTENSIONS = {'toc' : {}}
+    PROCESS_SAFE = True
 
     def process_text(self, input_text):
+        # Send markdown's log messages to this artifact's log while converting,
+        # removing the handler afterwards so handlers don't accumulate.
         markdown_logger = logging.getLogger('MARKDOWN')
-        markdown_logger.addHandler(self.log.handlers[-1])
+        handler = self.log.handlers[-1]
+        markdown_logger.addHandler(handler)
+        try:
+            return self.convert(input_text)
+        finally:
+            markdown_logger.removeHandler(handler)
 
+    def convert(self, input_text):
         if len(self.args()) > 0:
             extensions = self.args().keys()
             extension_configs = self.args()
@@ -24,6 +24,23 @@ class PygmentsFilter(Filter):
     MARKUP_OUTPUT_EXTENSIONS = [".html", ".tex", ".svg"] # make sure .html is first!
     OUTPUT_EXTENSIONS = MARKUP_OUTPUT_EXTENSIONS + IMAGE_OUTPUT_EXTENSIONS
     ALIASES = ['pyg', 'pygments']
+    PROCESS_SAFE = True
+
+    def is_process_safe(self):
+        # Image output is written directly to the output file, and generating
+        # a stylesheet changes the artifact's ext and final attributes.
+        if not self.PROCESS_SAFE or self.artifact.ext in self.IMAGE_OUTPUT_EXTENSIONS:
+            return False
+        return not self.is_stylesheet_request()
+
+    def is_stylesheet_request(self):
+        """
+        Whether the input is a virtual empty .css or .sty file, in which case a
+        stylesheet is generated.
+        """
+        if not self.artifact.prior.ext in [".css", ".sty"]:
+            return False
+        return not self.artifact.input_data.as_text()
 
     @classmethod
     def docmd_css(klass, style='default'):
@@ -124,7 +141,7 @@ class PygmentsFilter(Filter):
             formatter = get_formatter_for_filename(self.artifact.name, **formatter_args)
 
             if self.artifact.ext in self.IMAGE_OUTPUT_EXTENSIONS:
-                with open(self.artifact.output_data.data_file(), 'wb') as f:
+                with self.open_output_file() as f:
                     f.write(highlight(self.artifact.input_data.join(), lexer, formatter))
             else:
                 output_dict = OrderedDict()
@@ -1,7 +1,7 @@
 from dexy.filter import Filter
 import json
 import copy
-from ordereddict import OrderedDict
+import itertools
 
 class MarkupTagsFilter(Filter):
     """
@@ -9,13 +9,16 @@ class MarkupTagsFilter(Filter):
     """
     ALIASES = ['tags']
 
-    def process_text(self, input_text):
+    def process_stream(self, input_lines):
         tags = copy.copy(self.args()['tags'])
         open_tags = "".join("<%s>" % t for t in tags)
         tags.reverse()
         close_tags = "".join("</%s>" % t for t in tags)
 
-        return "%s\n%s\n%s" % (open_tags, input_text, close_tags)
+        yield "%s\n" % open_tags
+        for line in input_lines:
+            yield line
+        yield "\n%s" % close_tags
 
 class StartSpaceFilter(Filter):
     """
@@ -25,18 +28,19 @@ class StartSpaceFilter(Filter):
     """
     ALIASES = ['ss', 'startspace']
 
-    def process_text(self, input_text):
-        return "\n".join(" %s" % line for line in input_text.splitlines())
+    def process_stream(self, input_lines):
+        for i, line in enumerate(input_lines):
+            if i > 0:
+                yield "\n"
+            yield " %s" % line.rstrip("\r\n")
 
 class SectionsByLineFilter(Filter):
     ALIASES = ['lines']
     OUTPUT_DATA_TYPE = 'sectioned'
 
-    def process_text_to_dict(self, input_text):
-        data_dict = OrderedDict()
-        for i, line in enumerate(input_text.splitlines()):
-            data_dict["%s" % (i+1)] = line
-        return data_dict
+    def process_stream(self, input_lines):
+        for i, line in enumerate(input_lines):
+            yield "%s" % (i+1), line.rstrip("\r\n")
 
 class PrettyPrintJsonFilter(Filter):
     ALIASES = ['ppjson']
@@ -57,17 +61,31 @@ class JoinFilter(Filter):
     OUTPUT_EXTENSIONS = [".*"]
     ALIASES = ['join']
 
-    def process(self):
-        joined_data = "\n".join(self.artifact.input_data.as_sectioned().values())
-        self.artifact.output_data.set_data(joined_data)
+    def process_stream(self, input_lines):
+        # The text of sectioned data is its sections joined by newlines.
+        for line in input_lines:
+            yield line
 
 class HeadFilter(Filter):
     """
     Returns just the first 10 lines of input.
     """
     ALIASES = ['head']
-    def process_text(self, input_text):
-        return "\n".join(input_text.split("\n")[0:10]) + "\n"
+    def process_stream(self, input_lines):
+        # Each of the first 10 newline-separated pieces of the input is
+        # followed by a newline, including the empty piece after a trailing
+        # newline, as when the text is split on "\n".
+        n = 0
+        line = "\n"
+        for line in itertools.islice(input_lines, 10):
+            n += 1
+            if line.endswith("\n"):
+                yield line
+            else:
+                yield "%s\n" % line
+
+        if n < 10 and line.endswith("\n"):
+            yield "\n"
 
 class WordWrapFilter(Filter):
     """
@@ -19,6 +19,7 @@ class TemplateFilter(Filter):
     FINAL = True
     TEMPLATE_PLUGINS = [
         ClippyHelperTemplatePlugin,
+        ColumnsTemplatePlugin,
         DexyVersionTemplatePlugin,
         DexyRootTemplatePlugin,
 #        GlobalsTemplatePlugin,
@@ -166,7 +167,8 @@ class JinjaFilter(JinjaTextFilter):
             self.log.debug("creating jinja template from input text")
             template = env.from_string(self.artifact.input_data.as_text())
             self.log.debug("about to process jinja template")
-            template.stream(template_data).dump(self.artifact.output_data.storage.data_file(), encoding="utf-8")
+            with self.open_output_file() as f:
+                template.stream(template_data).dump(f, encoding="utf-8")
         except (TemplateSyntaxError, UndefinedError, TypeError) as e:
             self.handle_jinja_exception(e, self.artifact.input_data.as_text(), template_data)
 
@@ -174,6 +176,7 @@ class JinjaJustInTimeFilter(JinjaFilter):
     ALIASES = ['jinjajit']
     TEMPLATE_PLUGINS = [
         ClippyHelperTemplatePlugin,
+        ColumnsTemplatePlugin,
         DexyVersionTemplatePlugin,
 #        GlobalsTemplatePlugin,
         InputsJustInTimeTemplatePlugin,
@@ -215,7 +218,8 @@ class WebsiteTemplateJinjaFilter(JinjaFilter):
 
         try:
             template = env.from_string(website_template.output_text())
-            template.stream(template_data).dump(self.artifact.output_data.storage.data_file(), encoding="utf-8")
+            with self.open_output_file() as f:
+                template.stream(template_data).dump(f, encoding="utf-8")
         except (TemplateSyntaxError, UndefinedError, TypeError) as e:
             self.handle_jinja_exception(e, website_template.output_text(), template_data)
 
@@ -6,7 +6,9 @@ from pygments.styles import get_all_styles
 import calendar
 import dexy.artifact
 import dexy.commands
+import dexy.data
 import dexy.exceptions
+import dexy.helpers
 import json
 import os
 import pprint
@@ -70,6 +72,14 @@ class RegularExpressionsTemplatePlugin(TemplatePlugin):
     def run(self):
         return { 're_match' : re.match, 're_search' : re.search}
 
+class ColumnsTemplatePlugin(TemplatePlugin):
+    """
+    Reads columns written by dexy.helpers.ColumnData, e.g. columns(d['data.columns']).
+    Large files are memory-mapped, so columns are read without copying.
+    """
+    def run(self):
+        return { 'columns' : dexy.helpers.Columns }
+
 class PythonBuiltinsTemplatePlugin(TemplatePlugin):
     # Intended to be all builtins that make sense to run within a document.
     PYTHON_BUILTINS = [abs, all, any, bin, bool, bytearray, callable, chr,
@@ -199,7 +209,9 @@ class InputsTemplatePlugin(TemplatePlugin):
 
     @classmethod
     def d_data_for_artifact(klass, a):
-        data = a.output_data.data()
+        # Sections are read when they are used, large files are
+        # memory-mapped and only read in full when used as a string.
+        data = a.output_data.view()
 
         # Do any special handling of data
 #        if a.ext == '.json':
@@ -214,7 +226,7 @@ class InputsTemplatePlugin(TemplatePlugin):
 #        else:
 #            data = a.data_dict
 
-        if hasattr(data, 'keys') and data.keys() == ['1']:
+        if isinstance(data, (dict, dexy.data.LazySections)) and data.keys() == ['1']:
             return data['1']
         else:
             return data
@@ -0,0 +1,70 @@
+from dexy.datacache import estimate_size
+from dexy.doc import Doc
+from ordereddict import OrderedDict
+import threading
+
+class ReleaseTracker(object):
+    """
+    Counts how many artifacts still have to read each artifact's output, and
+    clears the output data from memory once the last of them has completed.
+    If max_bytes is set, the data held longest is also released whenever the
+    data held in total is larger than max_bytes.
+
+    Released data is read from disk again if it's needed later. Artifacts
+    which weren't in the task graph, like docs added while running, are
+    never released.
+    """
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.consumers = {}
+        self.inputs = {}
+        self.held = OrderedDict()
+        self.held_size = 0
+
+    def add_consumer(self, artifact, inputs):
+        self.inputs[artifact] = inputs
+        self.consumers.setdefault(artifact, 0)
+        for input_artifact in inputs:
+            self.consumers[input_artifact] = self.consumers.get(input_artifact, 0) + 1
+
+    def add_graph(self, graph):
+        """
+        Each filter artifact reads the output of the artifact before it, and
+        the outputs of the child docs of its doc.
+        """
+        for task in graph.tasks:
+            if isinstance(task, Doc):
+                child_artifacts = [c.final_artifact for c in task.children if isinstance(c, Doc)]
+                for i, artifact in enumerate(task.artifacts):
+                    if i == 0:
+                        self.add_consumer(artifact, [])
+                    else:
+                        self.add_consumer(artifact, [task.artifacts[i-1]] + child_artifacts)
+
+    def completed(self, task):
+        with self.lock:
+            if not task in self.consumers:
+                return
+
+            for input_artifact in self.inputs.pop(task, []):
+                self.consumers[input_artifact] -= 1
+                if self.consumers[input_artifact] == 0:
+                    self.release(input_artifact)
+
+            if self.consumers[task] == 0:
+                self.release(task)
+            else:
+                size = 0
+                if task.output_data._data is not None:
+                    size = estimate_size(task.output_data._data)
+                self.held[task] = size
+                self.held_size += size
+
+            while self.max_bytes and self.held_size > self.max_bytes:
+                self.release(next(iter(self.held)))
+
+    def release(self, artifact):
+        if artifact in self.held:
+            self.held_size -= self.held.pop(artifact)
+        artifact.output_data.clear_data()
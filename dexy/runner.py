@@ -1,9 +1,18 @@
+from dexy.collector import GarbageCollector
 from dexy.doc import Doc
 from dexy.database import Database
+from dexy.datacache import DataCache
 from dexy.doc import PatternDoc
+from dexy.graph import TaskGraph
+from dexy.manifest import Manifest
 from dexy.params import RunParams
+from dexy.release import ReleaseTracker
 from dexy.reporter import Reporter
+from dexy.scheduler import Scheduler
+from dexy.statcache import StatCache
+from dexy.storeindex import StoreIndex
 import logging
+import multiprocessing
 import os
 
 class Runner(object):
@@ -14,6 +23,11 @@ class Runner(object):
         self.params = params
         self.args = args
         self.registered = []
+        self.process_pool = None
+        self.data_cache = DataCache(self.params.data_cache_size)
+        self.release_tracker = ReleaseTracker(self.params.memory_ceiling)
+        self.stat_cache = StatCache(self.params.stat_cache_file)
+        self.store_index = StoreIndex(self.params.artifacts_dir)
         self.reports_dirs = [c.REPORTS_DIR for c in Reporter.plugins]
 
     def setup_dexy_dirs(self):
@@ -74,32 +88,107 @@ class Runner(object):
 
             self.docs.append(doc)
 
+    def setup_graph(self):
+        """
+        Builds the graph of all tasks to be run and sorts it, so circular
+        dependencies are found before any filters are run.
+        """
+        self.graph = TaskGraph(*self.docs)
+        self.graph.sort()
+        self.release_tracker.add_graph(self.graph)
+        self.log.debug("%s tasks in task graph" % len(self.graph.tasks))
+
+    def setup_manifest(self):
+        """
+        Loads the manifest from the last run and restores docs which haven't
+        changed since then.
+        """
+        self.manifest = Manifest(self)
+        n = self.manifest.restore(self.graph)
+        self.log.debug("%s docs unchanged since last run" % n)
+
+    def save_manifest(self):
+        self.manifest.update(self.graph)
+        self.manifest.save()
+
+    def setup_store_index(self):
+        """
+        Lists the files in the artifacts directory, so checking whether data
+        is cached doesn't need a filesystem call per artifact.
+        """
+        self.store_index.load()
+        self.log.debug("%s files in artifacts directory" % len(self.store_index.filepaths))
+
     def setup_db(self):
         db_class = Database.aliases[self.params.db_alias]
         self.db = db_class(self)
         self.batch_id = self.db.get_next_batch_id()
+        self.db.load_previous_batch(self.batch_id)
 
     def save_db(self):
         self.db.save()
 
+    def collect_garbage(self, batches=None, days=None):
+        """
+        Removes artifacts and task records which aren't used by the last
+        `batches` batches or by batches from the last `days` days.
+        """
+        db_class = Database.aliases[self.params.db_alias]
+        self.db = db_class(self)
+        try:
+            return GarbageCollector(self).collect(batches, days)
+        finally:
+            self.save_db()
+
+    def setup_process_pool(self):
+        """
+        Start worker processes for running process-safe filter methods, if
+        more than 1 process has been requested.
+        """
+        if self.params.processes > 1:
+            self.log.debug("starting %s worker processes" % self.params.processes)
+            self.process_pool = multiprocessing.Pool(self.params.processes)
+
+    def teardown_process_pool(self):
+        if self.process_pool:
+            self.process_pool.close()
+            self.process_pool.join()
+            self.process_pool = None
+
     def run(self):
         self.setup_dexy_dirs()
         self.setup_log()
+        self.setup_store_index()
         self.setup_db()
         self.setup_docs()
+        self.setup_graph()
+        self.setup_manifest()
 
         self.log.debug("batch id is %s" % self.batch_id)
 
-        for doc in self.docs:
-            for task in doc:
-                task()
+        # Start worker processes before any worker threads are started.
+        self.setup_process_pool()
+
+        try:
+            if self.params.workers > 1:
+                self.log.debug("running tasks in %s worker threads" % self.params.workers)
+                Scheduler(self, self.params.workers).run(*self.graph.roots)
+            else:
+                self.graph.run()
+        finally:
+            self.teardown_process_pool()
 
         self.save_db()
+        self.save_manifest()
+        self.stat_cache.save()
+        self.log.debug("data cache had %s hits and %s misses" % (self.data_cache.hits, self.data_cache.misses))
+
+        if self.params.gc_batches or self.params.gc_days:
+            removed = self.collect_garbage(self.params.gc_batches, self.params.gc_days)
+            self.log.debug("removed %(tasks)s task records, %(files)s files and %(dirs)s directories" % removed)
 
     def run_tasks(self, *tasks):
-        for task in tasks:
-            for t in task:
-                t()
+        TaskGraph(*tasks).run()
 
     def register(self, task):
         """
@@ -0,0 +1,158 @@
+from dexy.artifact import Artifact
+import Queue
+import collections
+import dexy.exceptions
+import sys
+import threading
+
+class Scheduler(object):
+    """
+    Runs tasks in dependency order, dispatching each task to a bounded pool of
+    worker threads as soon as everything it depends on has completed.
+
+    A task depends on each of its children. An artifact additionally depends
+    on the siblings which precede it, since it works on the output of the
+    previous artifact and hashes the docs completed before it.
+
+    State transitions, pre/post methods and database bookkeeping for the tasks
+    in the graph happen in the main thread, only Task.run is called from the
+    workers. Docs added by a filter while it runs, via Artifact.add_doc, are
+    run serially by runner.run_tasks in the worker thread which added them, so
+    their pre/post methods and database calls happen in that worker. The
+    database serializes access with a lock.
+    """
+    def __init__(self, runner, workers):
+        self.runner = runner
+        self.workers = workers
+
+    def setup(self):
+        self.expanded = set()
+        self.dependencies = {}
+        self.dependents = {}
+        self.parents = {}
+        self.ready = collections.deque()
+        self.in_flight = 0
+
+        self.inbox = Queue.Queue()
+        self.outbox = Queue.Queue()
+
+        self.threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def teardown(self):
+        for thread in self.threads:
+            self.inbox.put(None)
+
+    def work(self):
+        """
+        Loop run in each worker thread.
+        """
+        while True:
+            task = self.inbox.get()
+            if task is None:
+                return
+            try:
+                task.run()
+                self.outbox.put((task, None))
+            except Exception:
+                self.outbox.put((task, sys.exc_info()))
+
+    def add_dependency(self, task, dependency):
+        self.dependencies.setdefault(task, set()).add(dependency)
+        self.dependents.setdefault(dependency, []).append(task)
+
+    def expand(self, root):
+        """
+        Walks the tree of tasks starting at root, running pre methods and
+        recording dependencies for all tasks not yet complete.
+        """
+        expanded = []
+        stack = [root]
+        while stack:
+            task = stack.pop()
+
+            if task in self.expanded or task.state == 'complete':
+                continue
+            elif task.state == 'running':
+                raise dexy.exceptions.CircularDependency(task.key)
+            elif task.state != 'setup':
+                raise dexy.exceptions.UnexpectedState("%s in %s" % (task.state, task.key))
+
+            task.transition('running')
+            task.pre()
+            self.expanded.add(task)
+            self.dependencies.setdefault(task, set())
+            expanded.append(task)
+
+            preceding = []
+            for child in task.children:
+                self.parents.setdefault(child, []).append(task)
+
+                if child.state == 'complete':
+                    task.add_completed_child(child)
+                else:
+                    self.add_dependency(task, child)
+                    if isinstance(child, Artifact):
+                        for sibling in preceding:
+                            if sibling.state != 'complete':
+                                self.add_dependency(child, sibling)
+                    stack.append(child)
+
+                preceding.append(child)
+
+        for task in expanded:
+            if not self.dependencies[task]:
+                self.ready.append(task)
+
+    def dispatch(self, task):
+        # Docs added while running earlier children are already complete.
+        for child in task.children:
+            if child.state == 'complete':
+                task.add_completed_child(child)
+
+        self.runner.db.add_task_before_running(task)
+        self.in_flight += 1
+        self.inbox.put(task)
+
+    def complete(self, task):
+        self.runner.db.update_task_after_running(task)
+        task.post()
+        task.transition('complete')
+        self.runner.release_tracker.completed(task)
+
+        for parent in self.parents.get(task, []):
+            parent.add_completed_child(task)
+
+        for dependent in self.dependents.pop(task, []):
+            waiting = self.dependencies[dependent]
+            waiting.discard(task)
+            if not waiting and dependent in self.expanded:
+                self.ready.append(dependent)
+
+    def run(self, *tasks):
+        self.setup()
+        try:
+            for task in tasks:
+                self.expand(task)
+
+            while self.ready or self.in_flight:
+                while self.ready:
+                    self.dispatch(self.ready.popleft())
+
+                task, exc_info = self.outbox.get()
+                self.in_flight -= 1
+
+                if exc_info:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+
+                self.complete(task)
+
+            unfinished = [t.key for t in self.expanded if t.state != 'complete']
+            if unfinished:
+                raise dexy.exceptions.CircularDependency(", ".join(sorted(unfinished)))
+        finally:
+            self.teardown()
@@ -0,0 +1,63 @@
+import dexy.storage
+import hashlib
+import json
+import os
+import threading
+
+class StatCache(object):
+    """
+    Content fingerprints of source files, persisted between runs along with
+    each file's inode, mtime and size. A file is only read again when its
+    stat info changes, and then it is hashed in chunks rather than being read
+    into memory all at once.
+    """
+    CHUNK_SIZE = 65536
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def load(self):
+        with self.lock:
+            if self.entries is None:
+                if self.filename and os.path.exists(self.filename):
+                    with open(self.filename, "rb") as f:
+                        self.entries = json.load(f)
+                else:
+                    self.entries = {}
+
+    def save(self):
+        if self.filename and self.entries is not None:
+            with dexy.storage.atomic_write(self.filename) as f:
+                json.dump(self.entries, f)
+
+    @classmethod
+    def stat_key(klass, filepath):
+        stat_info = os.stat(filepath)
+        return "%s:%r:%s" % (stat_info.st_ino, stat_info.st_mtime, stat_info.st_size)
+
+    @classmethod
+    def compute_fingerprint(klass, filepath):
+        h = hashlib.md5()
+        with open(filepath, "rb") as f:
+            chunk = f.read(klass.CHUNK_SIZE)
+            while chunk:
+                h.update(chunk)
+                chunk = f.read(klass.CHUNK_SIZE)
+        return h.hexdigest()
+
+    def fingerprint(self, filepath):
+        """
+        Returns a digest of the contents of the file at filepath.
+        """
+        self.load()
+
+        stat_key = self.stat_key(filepath)
+        entry = self.entries.get(filepath)
+        if entry and entry[0] == stat_key:
+            return entry[1]
+
+        fingerprint = self.compute_fingerprint(filepath)
+        self.entries[filepath] = [stat_key, fingerprint]
+        return fingerprint
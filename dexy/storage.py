@@ -1,13 +1,180 @@
 from dexy.plugin import PluginMeta
 import shutil
 from ordereddict import OrderedDict
+import contextlib
+import dexy.exceptions
+import errno
+import gzip
+import mmap
 import os
+import re
+import sqlite3
+import stat
+import thread
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Artifacts and working directories are spread over two levels of
+# subdirectories named after the first characters of their hashstrings, so no
+# single directory gets too large. Earlier versions of dexy stored them
+# directly in the artifacts directory.
+ARTIFACT_NAME = re.compile("^([0-9a-f]{8,})(\..+)?$")
+SHARD_NAME = re.compile("^[0-9a-f]{2}$")
+
+def shard_path(base_dir, hashstring, filename):
+    return os.path.join(base_dir, hashstring[0:2], hashstring[2:4], filename)
+
+def makedirs(dirpath):
+    """
+    Creates dirpath and its parents, doesn't complain if another thread
+    already created it.
+    """
+    try:
+        os.makedirs(dirpath)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+def migrate_flat_layout(artifacts_dir, work_dir):
+    """
+    Moves artifacts and working directories stored directly in artifacts_dir
+    into the sharded layout. Returns the number of entries moved.
+    """
+    n = 0
+    for filename in os.listdir(artifacts_dir):
+        filepath = os.path.join(artifacts_dir, filename)
+        m = ARTIFACT_NAME.match(filename)
+        if not m:
+            continue
+
+        if os.path.isdir(filepath):
+            new_filepath = shard_path(work_dir, m.group(1), filename)
+        else:
+            new_filepath = shard_path(artifacts_dir, m.group(1), filename)
+
+        if os.path.exists(new_filepath):
+            continue
+
+        makedirs(os.path.dirname(new_filepath))
+        os.rename(filepath, new_filepath)
+        n += 1
+    return n
+
+# Files are written under a temporary name in the same directory and renamed
+# into place once they are complete, so a file which exists is never only
+# partly written, even if dexy was interrupted while writing it. Temporary
+# files left behind by an interrupted run are removed by the garbage
+# collector.
+TEMP_PREFIX = ".tmp-"
+
+def temp_path(filepath):
+    dirname, filename = os.path.split(filepath)
+    tmp_filename = "%s%s-%s-%s" % (TEMP_PREFIX, filename, os.getpid(), thread.get_ident())
+    return os.path.join(dirname, tmp_filename)
+
+def rename(src, dest):
+    """
+    Renames src to dest, replacing dest if it exists.
+    """
+    if os.name == 'nt' and os.path.lexists(dest):
+        os.remove(dest)
+    os.rename(src, dest)
+
+@contextlib.contextmanager
+def atomic_path(filepath):
+    """
+    Yields a temporary path to write to, which is renamed to filepath once
+    the with block completes without errors, and removed otherwise.
+    """
+    tmp = temp_path(filepath)
+    try:
+        yield tmp
+        rename(tmp, filepath)
+    except:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+@contextlib.contextmanager
+def atomic_write(filepath, mode="wb"):
+    """
+    Opens a temporary file for writing which is renamed to filepath once it
+    has been closed without errors, and removed otherwise.
+    """
+    with atomic_path(filepath) as tmp:
+        with open(tmp, mode) as f:
+            yield f
+
+# Cached files can be put in place by linking to them rather than copying
+# them. Files which are linked to are made read-only, so writing to a link
+# can't change the cached file.
+MATERIALIZE_STRATEGIES = ('copy', 'hardlink', 'reflink', 'symlink')
+FICLONE = 0x40049409 # linux ioctl to create a copy-on-write clone of a file
+
+def make_read_only(filepath):
+    mode = os.stat(filepath).st_mode
+    os.chmod(filepath, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+def reflink(src, dest):
+    if not fcntl:
+        raise OSError(errno.ENOTSUP, "reflinks not supported")
+
+    with open(src, "rb") as s:
+        with open(dest, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+def materialize(src, dest, strategy='copy'):
+    """
+    Puts the contents of file src at dest using the named strategy. If the
+    strategy doesn't work here, tries a reflink and then falls back to a
+    copy. Returns the name of the strategy used.
+    """
+    if not strategy in MATERIALIZE_STRATEGIES:
+        msg = "'%s' is not a valid materialize setting, choose one of %s"
+        raise dexy.exceptions.UserFeedback(msg % (strategy, ", ".join(MATERIALIZE_STRATEGIES)))
+
+    with atomic_path(dest) as tmp:
+        return link_or_copy(src, tmp, strategy)
+
+def link_or_copy(src, dest, strategy):
+    if strategy == 'hardlink':
+        try:
+            os.link(src, dest)
+            make_read_only(dest)
+            return strategy
+        except (OSError, AttributeError):
+            pass
+
+    elif strategy == 'symlink':
+        try:
+            os.symlink(os.path.abspath(src), dest)
+            make_read_only(src)
+            return strategy
+        except (OSError, AttributeError):
+            pass
+
+    if strategy != 'copy':
+        try:
+            reflink(src, dest)
+            return 'reflink'
+        except (IOError, OSError):
+            if os.path.lexists(dest):
+                os.remove(dest)
+
+    shutil.copyfile(src, dest)
+    return 'copy'
 
 # Generic Data
 
 class Storage:
     __metaclass__ = PluginMeta
 
+    # Whether single values can be read without loading all the data.
+    KEY_LOOKUPS = False
+
     @classmethod
     def is_active(klass):
         return True
@@ -19,31 +186,230 @@ class Storage:
         if not runner.__class__.__name__ == "Runner":
             raise Exception
 
+    def cache_key(self):
+        return (self.hashstring, self.ext, self.ALIASES[0])
+
+    def read_data(self):
+        """
+        Returns the stored data, read through the run's data cache so data
+        which has already been loaded is shared. Storage types implement
+        load_data to read data from disk.
+        """
+        return self.runner.data_cache.get(self.cache_key(), self.load_data)
+
 class GenericStorage(Storage):
     ALIASES = ['generic']
 
+    def data_path(self):
+        filename = "%s%s" % (self.hashstring, self.ext)
+        return shard_path(self.runner.params.artifacts_dir, self.hashstring, filename)
+
     def data_file(self):
-        return os.path.join(self.runner.params.artifacts_dir, "%s%s" % (self.hashstring, self.ext))
+        """
+        Returns the path to the file in which data is stored, creating its
+        directory if necessary so the file can be written to directly.
+        """
+        filepath = self.data_path()
+        parent_dir = os.path.dirname(filepath)
+        if not self.runner.store_index.has_dir(parent_dir):
+            makedirs(parent_dir)
+            self.runner.store_index.add_dir(parent_dir)
+        return filepath
 
     def data_file_exists(self):
-        return os.path.exists(self.data_file())
+        return self.runner.store_index.exists(self.data_path())
+
+    def index_data_file(self):
+        """
+        Adds the data file to the store index if it was written without
+        going through this storage, e.g. by a filter which opened it itself.
+        """
+        if os.path.exists(self.data_path()):
+            self.runner.store_index.add(self.data_path())
+
+    @contextlib.contextmanager
+    def write_file(self, filepath):
+        """
+        Opens filepath for writing using atomic_write, and adds it to the
+        store index once it has been written if it's in the artifacts
+        directory.
+        """
+        with atomic_write(filepath) as f:
+            yield f
+        self.runner.store_index.add(filepath)
 
     def write_data(self, data, filepath=None):
         if not filepath:
             filepath = self.data_file()
 
-        if self.data_file_exists():
-            shutil.copyfile(self.data_file(), filepath)
+        if self.data_file_exists() and filepath != self.data_path():
+            materialize(self.data_file(), filepath, self.runner.params.materialize)
         else:
-            with open(filepath, "wb") as f:
+            with self.write_file(filepath) as f:
                 f.write(data)
 
-    def read_data(self):
+    def copy_from_file(self, filename, strategy='copy'):
+        materialize(filename, self.data_file(), strategy)
+        self.runner.store_index.add(self.data_path())
+
+    def write_stream(self, stream, filepath=None):
+        """
+        Writes each string yielded by stream, so data doesn't have to be held
+        in memory all at once.
+        """
+        if not filepath:
+            filepath = self.data_file()
+
+        with self.write_file(filepath) as f:
+            for chunk in stream:
+                f.write(chunk)
+
+    def open_for_writing(self):
+        """
+        Returns a context manager opening a file to write data to directly.
+        The data file only exists once the file has been closed without
+        errors.
+        """
+        return self.write_file(self.data_file())
+
+    def open_data(self):
+        return open(self.data_file(), "rb")
+
+    def data_size(self):
+        return os.path.getsize(self.data_path())
+
+    def map_data(self):
+        """
+        Returns a read-only memory map of the data file.
+        """
+        with open(self.data_file(), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def load_data(self):
         with open(self.data_file(), "rb") as f:
             return f.read()
 
+# Compressed Data
+class CompressedStorage(GenericStorage):
+    """
+    Stores text data gzip-compressed, in the data file's path with a .gz
+    suffix. Data is compressed if its extension is in the compress_extensions
+    param and it is at least compress_min_size bytes, otherwise it is stored
+    as usual.
+    """
+    ALIASES = ['compressed']
+    COMPRESS_LEVEL = 6
+    SUFFIX = ".gz"
+
+    def compressed_path(self):
+        return "%s%s" % (self.data_path(), self.SUFFIX)
+
+    def is_compressed(self):
+        return self.runner.store_index.exists(self.compressed_path())
+
+    def should_compress(self, size=None):
+        """
+        Whether to compress data of this extension. Streamed data is
+        compressed whatever its size, as the size isn't known in advance.
+        """
+        if not self.ext in self.runner.params.compress_extensions:
+            return False
+        return size is None or size >= self.runner.params.compress_min_size
+
+    def open_compressed(self):
+        return gzip.open(self.compressed_path(), "rb")
+
+    @contextlib.contextmanager
+    def write_compressed(self):
+        self.data_file()
+        with self.write_file(self.compressed_path()) as f:
+            filename = os.path.basename(self.data_path())
+            with gzip.GzipFile(filename, "wb", self.COMPRESS_LEVEL, f) as gzip_file:
+                yield gzip_file
+
+    def data_file_exists(self):
+        return GenericStorage.data_file_exists(self) or self.is_compressed()
+
+    def index_data_file(self):
+        GenericStorage.index_data_file(self)
+        if os.path.exists(self.compressed_path()):
+            self.runner.store_index.add(self.compressed_path())
+
+    def write_data(self, data, filepath=None):
+        if filepath and self.is_compressed():
+            # Decompress straight into the file.
+            with self.open_compressed() as f:
+                with atomic_write(filepath) as output_file:
+                    shutil.copyfileobj(f, output_file)
+        elif not filepath and self.should_compress(len(data)):
+            with self.write_compressed() as f:
+                f.write(data)
+        else:
+            GenericStorage.write_data(self, data, filepath)
+
+    def write_stream(self, stream, filepath=None):
+        if filepath or not self.should_compress():
+            GenericStorage.write_stream(self, stream, filepath)
+        else:
+            with self.write_compressed() as f:
+                for chunk in stream:
+                    f.write(chunk)
+
+    def open_for_writing(self):
+        if self.should_compress():
+            return self.write_compressed()
+        else:
+            return GenericStorage.open_for_writing(self)
+
+    def copy_from_file(self, filename, strategy='copy'):
+        if self.should_compress(os.path.getsize(filename)):
+            with open(filename, "rb") as input_file:
+                with self.write_compressed() as f:
+                    shutil.copyfileobj(input_file, f)
+        else:
+            GenericStorage.copy_from_file(self, filename, strategy)
+
+    def open_data(self):
+        if self.is_compressed():
+            return self.open_compressed()
+        else:
+            return GenericStorage.open_data(self)
+
+    def data_size(self):
+        if self.is_compressed():
+            return os.path.getsize(self.compressed_path())
+        else:
+            return GenericStorage.data_size(self)
+
+    def map_data(self):
+        if self.is_compressed():
+            return self.read_data()
+        else:
+            return GenericStorage.map_data(self)
+
+    def load_data(self):
+        if self.is_compressed():
+            with self.open_compressed() as f:
+                return f.read()
+        else:
+            return GenericStorage.load_data(self)
+
 # Sectioned Data
 import json
+
+def dump_pairs(f, pairs):
+    """
+    Writes a JSON object to f one key, value pair at a time.
+    """
+    f.write("{")
+    for i, (k, v) in enumerate(pairs):
+        if i > 0:
+            f.write(", ")
+        f.write(json.dumps(k))
+        f.write(": ")
+        f.write(json.dumps(v))
+    f.write("}")
+
 class JsonOrderedStorage(GenericStorage):
     ALIASES = ['jsonordered']
     MAX_DATA_DICT_DECIMALS = 5
@@ -58,21 +424,25 @@ class JsonOrderedStorage(GenericStorage):
         return ordered_dict
 
     @classmethod
-    def convert_ordered_dict_to_numbered_dict(klass, ordered_dict):
-        if len(ordered_dict) >= klass.MAX_DATA_DICT_LENGTH:
+    def check_data_dict_length(klass, n):
+        if n >= klass.MAX_DATA_DICT_LENGTH:
             exception_msg = """Your data dict has %s items, which is greater than the arbitrary limit of %s items.
 You can increase this limit by changing MAX_DATA_DICT_DECIMALS."""
-            raise Exception(exception_msg % (len(ordered_dict), klass.MAX_DATA_DICT_LENGTH))
+            raise Exception(exception_msg % (n, klass.MAX_DATA_DICT_LENGTH))
+
+    @classmethod
+    def numbered_items(klass, items):
+        fmt = "%%0%sd:%%s" % klass.MAX_DATA_DICT_DECIMALS
+        for i, (k, v) in enumerate(items):
+            klass.check_data_dict_length(i + 1)
+            yield fmt % (i, k), v
 
-        data_dict = {}
-        i = -1
-        for k, v in ordered_dict.iteritems():
-            i += 1
-            fmt = "%%0%sd:%%s" % klass.MAX_DATA_DICT_DECIMALS
-            data_dict[fmt % (i, k)] = v
-        return data_dict
+    @classmethod
+    def convert_ordered_dict_to_numbered_dict(klass, ordered_dict):
+        klass.check_data_dict_length(len(ordered_dict))
+        return dict(klass.numbered_items(ordered_dict.iteritems()))
 
-    def read_data(self):
+    def load_data(self):
         with open(self.data_file(), "rb") as f:
             numbered_dict = json.load(f)
             return self.convert_numbered_dict_to_ordered_dict(numbered_dict)
@@ -81,15 +451,122 @@ You can increase this limit by changing MAX_DATA_DICT_DECIMALS."""
         if not filepath:
             filepath = self.data_file()
 
-        with open(filepath, "wb") as f:
-            numbered_dict = self.convert_ordered_dict_to_numbered_dict(data)
+        numbered_dict = self.convert_ordered_dict_to_numbered_dict(data)
+        with self.write_file(filepath) as f:
             json.dump(numbered_dict, f)
 
+    def write_stream(self, stream, filepath=None):
+        """
+        Writes each key, value pair yielded by stream.
+        """
+        if not filepath:
+            filepath = self.data_file()
+
+        with self.write_file(filepath) as f:
+            dump_pairs(f, self.numbered_items(stream))
+
+    def read_section(self, key):
+        return self.read_data()[key]
+
+    def read_keys(self):
+        return self.read_data().keys()
+
+class SectionsStorage(JsonOrderedStorage):
+    """
+    Stores sections in order with one JSON-encoded value per line, followed
+    by an index of the key, offset and length of each section and a trailer
+    holding the offset of the index. A single section can be read by loading
+    the index and seeking to the section. There is no limit on the number of
+    sections. Files written by JsonOrderedStorage can still be read.
+    """
+    ALIASES = ['sections']
+    MAGIC = "dexy-sections 1\n"
+    TRAILER_FORMAT = "%020d\n"
+    TRAILER_LENGTH = 21
+
+    index = None
+
+    def write_data(self, data, filepath=None):
+        self.write_stream(data.iteritems(), filepath)
+
+    def write_stream(self, stream, filepath=None):
+        """
+        Writes each key, value pair yielded by stream.
+        """
+        if not filepath:
+            filepath = self.data_file()
+
+        self.index = None
+        index = []
+        with self.write_file(filepath) as f:
+            f.write(self.MAGIC)
+            offset = len(self.MAGIC)
+
+            for k, v in stream:
+                line = "%s\n" % json.dumps(v)
+                f.write(line)
+                index.append((k, offset, len(line)))
+                offset += len(line)
+
+            f.write("%s\n" % json.dumps(index))
+            f.write(self.TRAILER_FORMAT % offset)
+
+    def is_indexed(self, f):
+        f.seek(0)
+        return f.read(len(self.MAGIC)) == self.MAGIC
+
+    def read_index(self, f):
+        f.seek(-self.TRAILER_LENGTH, os.SEEK_END)
+        f.seek(int(f.read(self.TRAILER_LENGTH)))
+        return json.loads(f.readline())
+
+    def load_index(self):
+        """
+        Returns an OrderedDict of the offset and length of each section, or
+        None if the data file was written by JsonOrderedStorage. The index is
+        only read once.
+        """
+        if self.index is None:
+            with open(self.data_file(), "rb") as f:
+                if not self.is_indexed(f):
+                    return None
+                self.index = OrderedDict((k, (offset, length)) for k, offset, length in self.read_index(f))
+        return self.index
+
+    def load_data(self):
+        with open(self.data_file(), "rb") as f:
+            if not self.is_indexed(f):
+                return JsonOrderedStorage.load_data(self)
+
+            index = self.read_index(f)
+            f.seek(len(self.MAGIC))
+
+            data = OrderedDict()
+            for k, offset, length in index:
+                data[k] = json.loads(f.readline())
+            return data
+
+    def read_section(self, key):
+        index = self.load_index()
+        if index is None:
+            return JsonOrderedStorage.read_section(self, key)
+
+        offset, length = index[key]
+        with open(self.data_file(), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def read_keys(self):
+        index = self.load_index()
+        if index is None:
+            return JsonOrderedStorage.read_keys(self)
+        return index.keys()
+
 # Key Value Data
 class JsonStorage(GenericStorage):
     ALIASES = ['json']
 
-    def read_data(self):
+    def load_data(self):
         with open(self.data_file(), "rb") as f:
             return json.load(f)
 
@@ -97,5 +574,89 @@ class JsonStorage(GenericStorage):
         if not filepath:
             filepath = self.data_file()
 
-        with open(filepath, "wb") as f:
+        with self.write_file(filepath) as f:
             json.dump(data, f)
+
+    def write_stream(self, stream, filepath=None):
+        """
+        Writes each key, value pair yielded by stream.
+        """
+        if not filepath:
+            filepath = self.data_file()
+
+        with self.write_file(filepath) as f:
+            dump_pairs(f, stream)
+
+def prefix_range(prefix):
+    """
+    Returns the lowest and highest strings to compare keys against to find
+    keys starting with prefix, the highest is excluded.
+    """
+    return prefix, prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+
+class Sqlite3Storage(JsonStorage):
+    """
+    Stores key, value pairs in a sqlite3 database in which keys are indexed,
+    so single values, or the values of all keys with a given prefix, can be
+    read without loading all the data. Values are JSON-encoded. All pairs
+    are written in a single transaction.
+    """
+    ALIASES = ['sqlite3']
+    KEY_LOOKUPS = True
+    SUFFIX = ".sqlite3"
+
+    def data_path(self):
+        return "%s%s" % (JsonStorage.data_path(self), self.SUFFIX)
+
+    def connect(self):
+        return contextlib.closing(sqlite3.connect(self.data_path()))
+
+    def write_data(self, data, filepath=None):
+        if filepath:
+            JsonStorage.write_data(self, data, filepath)
+        else:
+            self.write_stream(data.iteritems())
+
+    def write_stream(self, stream, filepath=None):
+        """
+        Writes each key, value pair yielded by stream.
+        """
+        if filepath:
+            return JsonStorage.write_stream(self, stream, filepath)
+
+        with atomic_path(self.data_file()) as tmp:
+            with contextlib.closing(sqlite3.connect(tmp)) as conn:
+                conn.execute("CREATE TABLE kvstore (key TEXT PRIMARY KEY, value TEXT)")
+                sql = "INSERT OR REPLACE INTO kvstore VALUES (?, ?)"
+                conn.executemany(sql, ((k, json.dumps(v)) for k, v in stream))
+                conn.commit()
+        self.runner.store_index.add(self.data_path())
+
+    def load_data(self):
+        with self.connect() as conn:
+            rows = conn.execute("SELECT key, value FROM kvstore")
+            return dict((k, json.loads(v)) for k, v in rows)
+
+    def read_value(self, key):
+        with self.connect() as conn:
+            row = conn.execute("SELECT value FROM kvstore WHERE key = ?", (key,)).fetchone()
+        if not row:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def read_keys(self):
+        with self.connect() as conn:
+            return [k for k, in conn.execute("SELECT key FROM kvstore ORDER BY key")]
+
+    def read_prefix(self, prefix):
+        """
+        Returns an OrderedDict of the pairs whose keys start with prefix,
+        sorted by key.
+        """
+        with self.connect() as conn:
+            if prefix:
+                sql = "SELECT key, value FROM kvstore WHERE key >= ? AND key < ? ORDER BY key"
+                rows = conn.execute(sql, prefix_range(unicode(prefix)))
+            else:
+                rows = conn.execute("SELECT key, value FROM kvstore ORDER BY key")
+            return OrderedDict((k, json.loads(v)) for k, v in rows)
@@ -0,0 +1,88 @@
+import dexy.storage
+import os
+import threading
+
+class StoreIndex(object):
+    """
+    The paths of the files and shard directories in the artifacts directory,
+    found by scanning it once, so checking whether data is stored doesn't
+    need a filesystem call. Paths are added as files are written, and removed
+    by the garbage collector.
+    """
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.lock = threading.Lock()
+        self.filepaths = None
+        self.dirs = None
+
+    def listdir(self, dirpath):
+        try:
+            return os.listdir(dirpath)
+        except OSError:
+            return []
+
+    def scan(self):
+        """
+        Lists the shard directories of the artifacts directory.
+        """
+        filepaths = set()
+        dirs = set()
+
+        for name in self.listdir(self.base_dir):
+            if not dexy.storage.SHARD_NAME.match(name):
+                continue
+
+            shard_dir = os.path.join(self.base_dir, name)
+            for subname in self.listdir(shard_dir):
+                if not dexy.storage.SHARD_NAME.match(subname):
+                    continue
+
+                subshard_dir = os.path.join(shard_dir, subname)
+                filenames = self.listdir(subshard_dir)
+                dirs.add(subshard_dir)
+                for filename in filenames:
+                    if not filename.startswith(dexy.storage.TEMP_PREFIX):
+                        filepaths.add(os.path.join(subshard_dir, filename))
+
+        self.filepaths = filepaths
+        self.dirs = dirs
+
+    def load(self):
+        with self.lock:
+            self.scan()
+
+    def ensure_loaded(self):
+        with self.lock:
+            if self.filepaths is None:
+                self.scan()
+
+    def exists(self, filepath):
+        self.ensure_loaded()
+        return filepath in self.filepaths
+
+    def in_store(self, filepath):
+        """
+        Whether filepath is in the artifacts directory.
+        """
+        return filepath.startswith(os.path.join(self.base_dir, ""))
+
+    def add(self, filepath):
+        """
+        Adds filepath if it's in the artifacts directory, other files written
+        by storage, such as output files, aren't indexed.
+        """
+        if self.in_store(filepath):
+            self.ensure_loaded()
+            self.filepaths.add(filepath)
+
+    def discard(self, filepath):
+        self.ensure_loaded()
+        self.filepaths.discard(filepath)
+
+    def has_dir(self, dirpath):
+        self.ensure_loaded()
+        return dirpath in self.dirs
+
+    def add_dir(self, dirpath):
+        self.ensure_loaded()
+        self.dirs.add(dirpath)
@@ -1,4 +1,5 @@
 import dexy.doc
+import dexy.graph
 import StringIO
 import dexy.exceptions
 import logging
@@ -59,12 +60,19 @@ class Task(object):
 
     def __call__(self, *args, **kw):
         for child in self.children:
-            for task in child:
-                task(*args, **kw)
+            dexy.graph.run_task(child, *args, **kw)
+            self.add_completed_child(child)
 
-            self.completed_children[child.key_with_class()] = child
-            self.completed_children.update(child.completed_children)
+        self.execute(*args, **kw)
 
+    def add_completed_child(self, child):
+        self.completed_children[child.key_with_class()] = child
+        self.completed_children.update(child.completed_children)
+
+    def execute(self, *args, **kw):
+        """
+        Runs this task, recording it in the database.
+        """
         self.runner.db.add_task_before_running(self)
         self.run(*args, **kw)
         self.runner.db.update_task_after_running(self)
@@ -12,6 +12,18 @@ def test_join_filter():
 
 def test_head_filter():
     assert_output("head", "1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n11\n", "1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n")
+    assert_output("head", "1\n2", "1\n2\n")
+    assert_output("head", "1\n2\n", "1\n2\n\n")
+    assert_output("head", "1\n2\n3\n4\n5\n6\n7\n8\n9\n10", "1\n2\n3\n4\n5\n6\n7\n8\n9\n10\n")
+    assert_output("head", "1\n2\n3\n4\n5\n6\n7\n8\n9\n", "1\n2\n3\n4\n5\n6\n7\n8\n9\n\n")
+
+def test_head_filter_empty_input():
+    with temprun() as runner:
+        open("empty.txt", "w").close()
+        doc = Doc("empty.txt|head", runner=runner)
+        runner.docs = [doc]
+        runner.run()
+        assert doc.output().data() == "\n"
 
 def test_word_wrap_filter():
     with temprun() as runner:
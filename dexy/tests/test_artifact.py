@@ -9,6 +9,7 @@ from dexy.params import RunParams
 from dexy.runner import Runner
 from dexy.tests.utils import tempdir
 from dexy.tests.utils import temprun
+import os
 import time
 
 def test_caching():
@@ -143,3 +144,43 @@ def test_parent_doc_hash_2():
         for doc in runner.registered:
             if doc.__class__.__name__ == 'FilterArtifact':
                 assert doc.source == 'cached'
+
+def test_initial_artifact_hash_ignores_mtime():
+    with temprun() as runner:
+        filename = "source.txt"
+
+        with open(filename, "w") as f:
+            f.write("hello this is some text")
+
+        artifact = InitialArtifact(filename, runner=runner)
+        artifact.name = filename
+        artifact.run()
+        first_hashstring = artifact.hashstring
+
+        os.utime(filename, (0, 0))
+
+        artifact = InitialArtifact(filename, runner=runner)
+        artifact.name = filename
+        artifact.run()
+
+        assert first_hashstring == artifact.hashstring
+
+def test_filter_artifact_hash_ignores_dict_order():
+    first = {}
+    first[8] = 1
+    first[0] = 2
+
+    second = {}
+    second[0] = 2
+    second[8] = 1
+    assert str(first) != str(second)
+
+    hashstrings = []
+    for filter_args in (first, second):
+        with temprun() as runner:
+            doc = Doc("abc.txt|dexy", contents="abc", dexy=filter_args, runner=runner)
+            runner.docs = [doc]
+            runner.run()
+            hashstrings.append(doc.final_artifact.hashstring)
+
+    assert hashstrings[0] == hashstrings[1]
@@ -0,0 +1,91 @@
+from dexy.commands import artifacts_dir_params
+from dexy.commands import gc_command
+from dexy.params import RunParams
+from dexy.runner import Runner
+from dexy.tests.utils import tempdir
+import dexy.storage
+import os
+
+def run(contents, **kwargs):
+    runner = Runner(RunParams(**kwargs), [["abc.txt|processtext", {"contents" : contents}]])
+    runner.run()
+    return runner
+
+def artifact_files(runner):
+    return [runner.docs[0].output().storage.data_file(), runner.docs[0].artifacts[0].output_data.storage.data_file()]
+
+def test_old_batches_removed():
+    with tempdir():
+        runner1 = run("first")
+        runner2 = run("second")
+
+        with open(os.path.join("artifacts", "notes.txt"), "w") as f:
+            f.write("not an artifact")
+        os.makedirs(runner1.docs[0].final_artifact.tmp_dir())
+        partial_file = dexy.storage.temp_path(artifact_files(runner2)[0])
+        with open(partial_file, "w") as f:
+            f.write("partly written")
+
+        removed = runner2.collect_garbage(batches=1)
+        assert removed['files'] == 3
+        assert removed['dirs'] == 1
+        assert removed['tasks'] > 0
+
+        assert not os.path.exists(partial_file)
+        assert not any(os.path.exists(f) for f in artifact_files(runner1))
+        assert not os.path.exists(runner1.docs[0].final_artifact.tmp_dir())
+        assert all(os.path.exists(f) for f in artifact_files(runner2))
+        assert os.path.exists(os.path.join("artifacts", "notes.txt"))
+        assert os.path.exists(runner2.params.db_file)
+        assert os.path.exists(runner2.params.manifest_file)
+
+        runner2.setup_db()
+        runner2.db.cursor.execute("select distinct batch_id from tasks")
+        assert [row['batch_id'] for row in runner2.db.cursor.fetchall()] == [runner2.batch_id - 1]
+
+def test_recent_batches_kept():
+    with tempdir():
+        runner1 = run("first")
+        runner2 = run("second")
+
+        removed = runner2.collect_garbage(days=1)
+        assert removed == { 'tasks' : 0, 'files' : 0, 'dirs' : 0 }
+        assert all(os.path.exists(f) for f in artifact_files(runner1))
+
+def test_collect_after_run():
+    with tempdir():
+        runner1 = run("first", gc_batches=1)
+        runner2 = run("second", gc_batches=1)
+        assert not any(os.path.exists(f) for f in artifact_files(runner1))
+        assert all(os.path.exists(f) for f in artifact_files(runner2))
+
+        runner3 = run("second", gc_batches=1)
+        assert runner3.docs[0].final_artifact.manifest_entry
+        assert runner3.docs[0].output().data() == "Dexy processed the text 'second'"
+
+def test_manifest_pruned():
+    with tempdir():
+        runner = run("first")
+        runner.manifest.entries["other.txt"] = {
+                'digest' : 'abc',
+                'artifacts' : [{ 'hashstring' : 'abcdef0123456789' }]
+                }
+        runner.manifest.save()
+
+        runner.collect_garbage(batches=1)
+        runner.manifest.load()
+        assert runner.manifest.entries.keys() == ["abc.txt|processtext"]
+
+def test_gc_command_uses_custom_artifacts_dir():
+    params = artifacts_dir_params("cache", db_file=os.path.join("cache", "dexy.sqlite3"))
+    assert params.work_dir == os.path.join("cache", "work")
+    assert params.manifest_file == os.path.join("cache", "dexy-manifest.json")
+    assert params.stat_cache_file == os.path.join("cache", "dexy-statcache.json")
+
+    with tempdir():
+        runner = Runner(params, [["abc.txt|processtext", {"contents" : "abc"}]])
+        runner.run()
+        gc_command(artifactsdir="cache", batches=1, dbfile=params.db_file)
+
+        assert os.path.exists(runner.docs[0].output().storage.data_file())
+        assert not os.path.exists("artifacts")
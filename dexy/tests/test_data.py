@@ -1,2 +1,203 @@
 from ordereddict import OrderedDict
 from dexy.runner import Runner
+from dexy.data import GenericData
+from dexy.data import KeyValueData
+from dexy.data import MappedText
+from dexy.data import SectionedData
+from dexy.datacache import DataCache
+from dexy.doc import Doc
+from dexy.params import RunParams
+from dexy.tests.utils import tempdir
+from dexy.tests.utils import temprun
+import mmap
+
+def test_iter_chunks():
+    with temprun() as runner:
+        data = GenericData("abcdef0123456789", ".txt", runner)
+        data.set_data("x" * 10)
+        assert list(data.iter_chunks(4)) == ["xxxx", "xxxx", "xx"]
+
+def test_iter_lines():
+    with temprun() as runner:
+        data = GenericData("abcdef0123456789", ".txt", runner)
+        data.set_data("line one\nline two\nline three")
+        assert list(data.iter_lines()) == ["line one\n", "line two\n", "line three"]
+
+def test_set_data_from_stream():
+    with temprun() as runner:
+        data = GenericData("abcdef0123456789", ".txt", runner)
+        data.set_data_from_stream("line %s\n" % i for i in range(3))
+        assert data.data() == "line 0\nline 1\nline 2\n"
+
+def test_sectioned_data_from_stream():
+    with temprun() as runner:
+        data = SectionedData("abcdef0123456789", ".txt", runner)
+        data.set_data_from_stream(("section %s" % i, "contents %s" % i) for i in range(3))
+
+        expected = OrderedDict()
+        for i in range(3):
+            expected["section %s" % i] = "contents %s" % i
+        assert data.data() == expected
+        assert list(data.iter_lines()) == ["contents 0\n", "contents 1\n", "contents 2"]
+
+def test_small_data_buffer_is_string():
+    with temprun() as runner:
+        data = GenericData("abcdef0123456789", ".txt", runner)
+        data.set_data("abc")
+        data.clear_data()
+        assert data.buffer() == "abc"
+
+def test_large_data_buffer_is_memory_mapped():
+    with tempdir():
+        runner = Runner(RunParams(mmap_threshold=10))
+        data = GenericData("abcdef0123456789", ".txt", runner)
+        data.set_data("0123456789" * 10)
+        data.clear_data()
+
+        buf = data.buffer()
+        assert isinstance(buf, mmap.mmap)
+        assert len(buf) == 100
+        assert buf[5:15] == "5678901234"
+        assert buf.find("9", 10) == 19
+        try:
+            buf[0] = "x"
+            assert False
+        except TypeError:
+            pass
+
+def test_output_to_file_does_not_load_data():
+    for materialize in ('copy', 'hardlink'):
+        with tempdir():
+            runner = Runner(RunParams(materialize=materialize))
+            data = GenericData("abcdef0123456789", ".txt", runner)
+            data.set_data("0123456789" * 10)
+            data.clear_data()
+            runner.data_cache = DataCache(1000)
+
+            data.output_to_file("output.txt")
+
+            with open("output.txt", "rb") as f:
+                assert f.read() == "0123456789" * 10
+            assert data._data is None
+            assert runner.data_cache.misses == 0
+            assert not runner.data_cache.entries
+
+def test_large_inputs_memory_mapped_in_templates():
+    with tempdir():
+        with open("data.txt", "w") as f:
+            f.write("0123456789" * 10)
+
+        contents = "{{ d['data.txt'].buffer().__class__.__name__ }} {{ d['data.txt'][5:15] }} {{ d['data.txt'].find('9', 10) }}"
+        doc = Doc("template.txt|jinja", Doc("data.txt"), contents=contents)
+        runner = Runner(RunParams(mmap_threshold=10), [doc])
+        runner.run()
+        assert doc.output().data() == "mmap 5678901234 19"
+
+def test_large_inputs_render_as_text_in_templates():
+    with tempdir():
+        with open("data.txt", "w") as f:
+            f.write("line one\nline two\n" * 5)
+
+        contents = "{{ d['data.txt'].splitlines()[1] }} {{ d['data.txt']|length }}\n{{ d['data.txt'] }}"
+        doc = Doc("template.txt|jinja", Doc("data.txt"), contents=contents)
+        runner = Runner(RunParams(mmap_threshold=10), [doc])
+        runner.run()
+        assert doc.output().data() == "line two 90\n" + "line one\nline two\n" * 5
+
+def test_mapped_text_is_string_compatible():
+    with tempdir():
+        runner = Runner(RunParams(mmap_threshold=10))
+        data = GenericData("abcdef0123456789", ".txt", runner)
+        data.set_data("0123456789" * 10)
+        data.clear_data()
+
+        text = data.view()
+        assert isinstance(text, MappedText)
+        assert not hasattr(text, 'keys')
+        assert text._map is None
+        assert isinstance(text.buffer(), mmap.mmap)
+        assert str(text) == "0123456789" * 10
+        assert text == "0123456789" * 10
+        assert "789" in text
+        assert text.startswith("0123")
+        assert text.upper() == "0123456789" * 10
+        assert text[-3:] == "789"
+        assert data._data is None
+
+def test_sectioned_inputs_are_mappings_in_templates():
+    with tempdir():
+        sections = OrderedDict()
+        sections['main'] = "main section"
+        data_doc = Doc("data.txt", contents=sections)
+        doc = Doc("template.txt|jinja", data_doc, contents="{{ d['data.txt']['main'] }}")
+        runner = Runner(RunParams(), [doc])
+        runner.run()
+        assert doc.output().data() == "main section"
+
+def test_sectioned_data_reads_single_sections():
+    with temprun() as runner:
+        data = SectionedData("abcdef0123456789", ".txt", runner)
+        data.set_data_from_stream(("section %s" % i, "contents %s" % i) for i in range(3))
+
+        data = SectionedData("abcdef0123456789", ".txt", runner)
+        assert data.section("section 1") == "contents 1"
+        assert data.section_keys() == ["section 0", "section 1", "section 2"]
+        assert data._data is None
+
+def test_lazy_sections():
+    with temprun() as runner:
+        data = SectionedData("abcdef0123456789", ".txt", runner)
+        data.set_data_from_stream(("section %s" % i, "contents %s" % i) for i in range(3))
+
+        data = SectionedData("abcdef0123456789", ".txt", runner)
+        sections = data.view()
+        assert sections.keys() == ["section 0", "section 1", "section 2"]
+        assert "section 2" in sections
+        assert sections["section 2"] == "contents 2"
+        assert sections.get("section 3") is None
+        assert sections._sections.keys() == ["section 2"]
+        assert data._data is None
+
+        assert sections.items() == data.data().items()
+
+def test_sections_lazily_loaded_in_templates():
+    with tempdir():
+        lines_doc = Doc("data.txt|lines", contents="line one\nline two\nline three")
+        doc = Doc("template.txt|jinja", lines_doc, contents="{{ d['data.txt|lines']['2'] }} {{ d['data.txt|lines'].keys()|length }}")
+        runner = Runner(RunParams(), [doc])
+        runner.run()
+        assert doc.output().data() == "line two 3"
+
+def test_key_value_lookups():
+    with temprun() as runner:
+        runner.params.storage_types = { 'keyvalue' : 'sqlite3' }
+        data = KeyValueData("abcdef0123456789", ".json", runner)
+        for i in range(5):
+            data.append("key %s" % i, "value %s" % i)
+        data.append("other", "other value")
+        data.save()
+
+        data = KeyValueData("abcdef0123456789", ".json", runner)
+        assert data.value("key 3") == "value 3"
+        assert data.query("key").keys() == ["key %s" % i for i in range(5)]
+        assert len(data.keys()) == 6
+        assert not data._data
+
+        values = data.view()
+        assert "other" in values
+        assert not "missing" in values
+        assert values["other"] == "other value"
+        assert not data._data
+
+        assert data.data()["key 1"] == "value 1"
+        assert data.value("key 1") == "value 1"
+        assert data.query("o").items() == [("other", "other value")]
+
+def test_key_values_looked_up_in_templates():
+    with tempdir():
+        kv_doc = Doc("hello.txt|keyvalueexample", contents="hello")
+        doc = Doc("template.txt|jinja", kv_doc, contents="{{ d['hello.txt|keyvalueexample']['foo'] }}")
+        runner = Runner(RunParams(storage_types={ 'keyvalue' : 'sqlite3' }), [doc])
+        runner.run()
+        assert doc.output().data() == "bar"
+        assert kv_doc.output().storage.__class__.__name__ == "Sqlite3Storage"
@@ -1,6 +1,12 @@
 from mock import MagicMock
 from datetime import datetime
+from dexy.database import Sqlite3
+from dexy.params import RunParams
+from dexy.runner import Runner
+from dexy.tests.utils import tempdir
 from dexy.tests.utils import temprun
+import os
+import sqlite3
 
 def test_add_task():
     with temprun() as runner:
@@ -15,7 +21,7 @@ def test_add_task():
                 }
         task = MagicMock(**attrs)
         runner.db.add_task_before_running(task)
-        runner.db.conn.commit()
+        runner.db.flush()
 
         sql = """select * from tasks"""
         runner.db.cursor.execute(sql)
@@ -43,16 +49,106 @@ def test_update_task():
                 }
         task = MagicMock(**attrs)
         runner.db.add_task_before_running(task)
-        runner.db.conn.commit()
+        runner.db.flush()
 
         attrs = {
                 "state" : "complete"
                 }
 
         runner.db.update_task_after_running(task)
+        runner.db.flush()
 
         sql = """select * from tasks"""
         runner.db.cursor.execute(sql)
         row = runner.db.cursor.fetchone()
 
         assert row['hashstring'] == 'abc123001'
+
+def test_wal_mode():
+    with temprun() as runner:
+        runner.db.cursor.execute("pragma journal_mode")
+        assert runner.db.cursor.fetchone()[0] == "wal"
+
+def test_update_merged_into_pending_insert():
+    with temprun() as runner:
+        attrs = {
+                "args" : {},
+                "doc.key" : "abc23456",
+                "key_with_batch_id.return_value" : "def1234556",
+                "runner.batch_id" : 1001,
+                "hashstring" : "abc123001",
+                "created_by_doc" : None,
+                "key" : "file.txt"
+                }
+        task = MagicMock(**attrs)
+        runner.db.add_task_before_running(task)
+        runner.db.update_task_after_running(task)
+
+        assert len(runner.db.pending_inserts) == 1
+        assert len(runner.db.pending_updates) == 0
+
+        runner.db.cursor.execute("select count(*) from tasks")
+        assert runner.db.cursor.fetchone()[0] == 0
+
+        runner.db.flush()
+
+        runner.db.cursor.execute("select * from tasks")
+        row = runner.db.cursor.fetchone()
+        assert row['hashstring'] == 'abc123001'
+        assert row['completed_at'] > row['started_at']
+
+def test_flush_after_flush_size_records():
+    with temprun() as runner:
+        runner.db.FLUSH_SIZE = 10
+        for i in range(25):
+            attrs = {
+                    "args" : {},
+                    "doc.key" : "abc23456",
+                    "key_with_batch_id.return_value" : "key-%s" % i,
+                    "runner.batch_id" : 1001,
+                    "created_by_doc" : None,
+                    "key" : "file%s.txt" % i
+                    }
+            runner.db.add_task_before_running(MagicMock(**attrs))
+
+        assert len(runner.db.pending_inserts) == 5
+
+        runner.db.cursor.execute("select count(*) from tasks")
+        assert runner.db.cursor.fetchone()[0] == 20
+
+def test_indexes():
+    with temprun() as runner:
+        runner.db.cursor.execute("pragma index_list(tasks)")
+        index_names = [row['name'] for row in runner.db.cursor.fetchall()]
+        for field in Sqlite3.INDEXES:
+            assert "tasks_%s" % field in index_names
+
+def test_indexes_added_to_existing_database():
+    with tempdir():
+        os.mkdir("artifacts")
+        conn = sqlite3.connect("artifacts/dexy.sqlite3")
+        conn.execute(Sqlite3.create_table_sql.im_func(Sqlite3))
+        conn.commit()
+        conn.close()
+
+        runner = Runner()
+        runner.setup_db()
+        runner.db.cursor.execute("pragma index_list(tasks)")
+        assert len(runner.db.cursor.fetchall()) == len(Sqlite3.INDEXES)
+
+def test_previous_batch_loaded_once():
+    with tempdir():
+        args = [["hello.txt|newdoc", { "contents" : "hello" }]]
+        runner = Runner(RunParams(), args)
+        runner.run()
+        parent_hashstring = runner.docs[0].final_artifact.hashstring
+
+        runner = Runner(RunParams(), args)
+        runner.setup_db()
+        batch_id, children = runner.db.previous_batch
+        assert batch_id == runner.batch_id
+        assert children.keys() == [parent_hashstring]
+
+        rows = runner.get_child_hashes_in_previous_batch(parent_hashstring)
+        assert [row['key'] for row in rows] == ["newfile.txt", "newfile.txt|processtext", "newfile.txt|processtext"]
+        assert runner.get_child_hashes_in_previous_batch("not-a-hashstring") == []
@@ -0,0 +1,80 @@
+from dexy.data import GenericData
+from dexy.data import SectionedData
+from dexy.datacache import DataCache
+from dexy.storage import GenericStorage
+from dexy.tests.utils import temprun
+from ordereddict import OrderedDict
+
+def test_hits_and_misses():
+    cache = DataCache(100)
+    loads = []
+    def load():
+        loads.append(1)
+        return "abc"
+
+    assert cache.get("a", load) == "abc"
+    assert cache.get("a", load) == "abc"
+    assert len(loads) == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.size == 3
+
+def test_least_recently_used_evicted():
+    cache = DataCache(10)
+    cache.add("a", "aaaa")
+    cache.add("b", "bbbb")
+    cache.get("a", None)
+    cache.add("c", "cccc")
+
+    assert cache.entries.keys() == ["a", "c"]
+    assert cache.size == 8
+
+def test_large_data_not_cached():
+    cache = DataCache(10)
+    assert cache.get("a", lambda: "x" * 11) == "x" * 11
+    assert cache.size == 0
+    assert not cache.entries
+
+def test_dicts_copied():
+    cache = DataCache(100)
+    d = OrderedDict()
+    d['1'] = "one"
+    cache.add("a", d)
+
+    cached = cache.get("a", None)
+    cached['2'] = "two"
+    assert cache.get("a", None).keys() == ['1']
+
+def test_data_objects_share_cache():
+    with temprun() as runner:
+        GenericData("abcdef0123456789", ".txt", runner).set_data("hello")
+        runner.data_cache = DataCache(100)
+
+        for i in range(3):
+            data = GenericData("abcdef0123456789", ".txt", runner)
+            assert data.data() == "hello"
+        assert runner.data_cache.misses == 1
+        assert runner.data_cache.hits == 2
+
+def test_empty_data_loaded_once():
+    with temprun() as runner:
+        data = SectionedData("abcdef0123456789", ".txt", runner)
+        data.set_data(OrderedDict())
+        data.clear_data()
+        runner.data_cache = DataCache(100)
+
+        assert data.data() == OrderedDict()
+        assert data.data() == OrderedDict()
+        assert runner.data_cache.misses == 1
+        assert runner.data_cache.hits == 0
+
+def test_storage_reads_share_cache():
+    with temprun() as runner:
+        GenericData("abcdef0123456789", ".txt", runner).set_data("hello")
+        runner.data_cache = DataCache(100)
+
+        storage = GenericStorage("abcdef0123456789", ".txt", runner)
+        assert storage.read_data() == "hello"
+        assert GenericData("abcdef0123456789", ".txt", runner).data() == "hello"
+        assert runner.data_cache.misses == 1
+        assert runner.data_cache.hits == 1
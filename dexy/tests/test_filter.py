@@ -0,0 +1,81 @@
+from dexy.doc import Doc
+from dexy.filter import ArtifactSummary
+from dexy.filter import Filter
+from dexy.params import RunParams
+from dexy.runner import Runner
+from dexy.tests.utils import tempdir
+from dexy.tests.utils import temprun
+import os
+import pickle
+
+class ProcessSafePid(Filter):
+    """
+    Returns the process id of the process which ran process_text.
+    """
+    ALIASES = ['processsafepid']
+    PROCESS_SAFE = True
+
+    def process_text(self, input_text):
+        self.log.debug("running in a worker process")
+        return "%s %s" % (self.artifact.filter_args()['label'], os.getpid())
+
+class UnsafePid(ProcessSafePid):
+    ALIASES = ['unsafepid']
+    PROCESS_SAFE = False
+
+def test_artifact_summary_is_picklable():
+    with temprun() as runner:
+        doc = Doc("hello.txt|processsafepid", contents="hello", processsafepid={'label' : 'x'}, runner=runner)
+        runner.run_tasks(doc)
+        artifact = doc.final_artifact
+
+        summary = pickle.loads(pickle.dumps(ArtifactSummary(artifact)))
+        assert summary.key == "hello.txt|processsafepid"
+        assert summary.filter_args() == {'label' : 'x'}
+        assert summary.prior.key == "hello.txt"
+        assert summary.web_safe_document_key() == "hello.txt-processsafepid.txt"
+        assert not 'contents' in summary.args
+
+def test_process_safe_filter_runs_in_worker_process():
+    with tempdir():
+        args = [
+                ["safe.txt|processsafepid", {"contents" : "hello", "processsafepid" : {"label" : "safe"}}],
+                ["unsafe.txt|unsafepid", {"contents" : "hello", "unsafepid" : {"label" : "unsafe"}}]
+                ]
+        runner = Runner(RunParams(processes=2), args)
+        runner.run()
+
+        safe_label, safe_pid = runner.docs[0].output().data().split()
+        unsafe_label, unsafe_pid = runner.docs[1].output().data().split()
+
+        assert safe_label == "safe"
+        assert unsafe_label == "unsafe"
+        assert int(safe_pid) != os.getpid()
+        assert int(unsafe_pid) == os.getpid()
+
+        assert runner.process_pool is None
+        assert "running in a worker process" in runner.docs[0].final_artifact.logstream.getvalue()
+
+def test_pygments_stylesheet_runs_in_main_process():
+    with tempdir():
+        open("pygments.css", "w").close()
+        doc = Doc("pygments.css|pyg")
+        runner = Runner(RunParams(processes=2), [doc])
+        runner.run()
+
+        assert doc.final_artifact.ext == ".css"
+        assert doc.final_artifact.final
+        assert ".hll" in doc.output().as_text()
+
+def test_markdown_logger_handlers_do_not_accumulate():
+    import logging
+    markdown_logger = logging.getLogger('MARKDOWN')
+    handlers_before = len(markdown_logger.handlers)
+
+    with tempdir():
+        args = [["doc%s.md|markdown" % i, {"contents" : "hello"}] for i in range(3)]
+        runner = Runner(RunParams(), args)
+        runner.run()
+        assert "<p>hello</p>" in runner.docs[0].output().data()
+
+    assert len(markdown_logger.handlers) == handlers_before
@@ -0,0 +1,36 @@
+from dexy.filter import Filter
+from dexy.plugins.example_filters import ExampleProcessTextMethod
+import dexy.fingerprints
+
+class VersionedFilter(Filter):
+    ALIASES = ['versionedfilter']
+    VERSION_COMMAND = 'echo 1.2.3'
+
+class VersionedSubclassFilter(VersionedFilter):
+    ALIASES = ['versionedsubclassfilter']
+
+def test_filter_fingerprint():
+    fingerprint = dexy.fingerprints.filter_fingerprint(VersionedFilter)
+    assert len(fingerprint) == 32
+    assert dexy.fingerprints.FILTERS[VersionedFilter] == fingerprint
+    assert dexy.fingerprints.filter_fingerprint(VersionedFilter) == fingerprint
+
+    assert dexy.fingerprints.filter_fingerprint(VersionedSubclassFilter) != fingerprint
+    assert dexy.fingerprints.filter_fingerprint(ExampleProcessTextMethod) != fingerprint
+
+def test_version_cached():
+    assert VersionedFilter.cached_version() == "1.2.3"
+    VersionedFilter.VERSION_COMMAND = 'echo 4.5.6'
+    try:
+        assert VersionedFilter.cached_version() == "1.2.3"
+    finally:
+        VersionedFilter.VERSION_COMMAND = 'echo 1.2.3'
+
+def test_method_fingerprint():
+    f1 = lambda x: x
+    f2 = lambda x: x + 1
+    assert dexy.fingerprints.method_fingerprint(f1) != dexy.fingerprints.method_fingerprint(f2)
+
+    m1 = ExampleProcessTextMethod().process_text
+    m2 = ExampleProcessTextMethod().process_text
+    assert dexy.fingerprints.method_fingerprint(m1) == dexy.fingerprints.method_fingerprint(m2)
@@ -0,0 +1,64 @@
+from dexy.doc import Doc
+from dexy.exceptions import *
+from dexy.graph import TaskGraph
+from dexy.runner import Runner
+from dexy.task import Task
+from dexy.tests.utils import temprun
+from nose.tools import raises
+
+class CountingTask(Task):
+    def run(self, *args, **kw):
+        self.runner.ran.append(self.key)
+
+def test_sort():
+    runner = Runner()
+    t1 = Task("1", runner=runner)
+    t2 = Task("2", t1, runner=runner)
+    t3 = Task("3", t1, runner=runner)
+    t4 = Task("4", t2, t3, runner=runner)
+
+    graph = TaskGraph(t4)
+    assert len(graph.tasks) == 4
+    assert [t.key for t in graph.sort()] == ['1', '2', '3', '4']
+
+def test_cycle_found_before_running():
+    with temprun() as runner:
+        runner.ran = []
+        t1 = CountingTask("1", runner=runner)
+        t2 = CountingTask("2", t1, runner=runner)
+        t3 = CountingTask("3", t2, runner=runner)
+        t1.children.append(t3)
+
+        graph = TaskGraph(CountingTask("0", runner=runner), t3)
+        try:
+            graph.sort()
+            assert False
+        except CircularDependency as e:
+            assert str(e) == "3 -> 2 -> 1 -> 3"
+
+        assert runner.ran == []
+
+def test_deep_chain():
+    with temprun() as runner:
+        runner.ran = []
+        task = CountingTask("0", runner=runner)
+        for i in range(1, 2000):
+            task = CountingTask("%s" % i, task, runner=runner)
+
+        graph = TaskGraph(task)
+        assert len(graph.sort()) == 2000
+        graph.run()
+
+        assert len(runner.ran) == 2000
+        assert runner.ran[0] == "0"
+        assert runner.ran[-1] == "1999"
+        assert task.state == 'complete'
+
+@raises(CircularDependency)
+def test_runner_checks_for_cycles():
+    with temprun() as runner:
+        d1 = Doc("abc.txt", contents="abc", runner=runner)
+        d2 = Doc("def.txt", d1, contents="def", runner=runner)
+        d1.children.append(d2)
+        runner.docs = [d2]
+        runner.run()
@@ -0,0 +1,242 @@
+from dexy.doc import Doc
+from dexy.exceptions import UserFeedback
+from dexy.helpers import ColumnData
+from dexy.helpers import Columns
+from dexy.helpers import KeyValueData
+from dexy.helpers import RowData
+from dexy.params import RunParams
+from dexy.runner import Runner
+from dexy.tests.utils import tempdir
+from nose.exc import SkipTest
+import array
+import mmap
+import os
+import shutil
+import sqlite3
+import sys
+
+def test_sqlite3_key_value_data():
+    with tempdir():
+        data = KeyValueData("data.sqlite3")
+        data.SQLITE3_BUFFER_SIZE = 3
+        for i in range(10):
+            data.append("key%s" % i, "value %s" % i)
+        data.append("other", "other value")
+        data.append("key1", "new value")
+        data.save()
+
+        # The data is in the main file, so a copy of it can be read.
+        assert not os.path.exists("data.sqlite3-wal")
+        shutil.copy("data.sqlite3", "copy.sqlite3")
+        assert KeyValueData("copy.sqlite3").retrieve("key1") == "new value"
+
+        data = KeyValueData("data.sqlite3")
+        assert data.mode == "read"
+        assert data.retrieve("key1") == "new value"
+        assert data.get("missing", "default") == "default"
+        assert len(data.keys()) == 11
+        assert data.query_prefix("key") == [("key%s" % i, "value %s" % i if i != 1 else "new value") for i in range(10)]
+        assert data.query_prefix("oth") == [("other", "other value")]
+        assert data.query_prefix("x") == []
+        assert len(data.query_prefix("")) == 11
+
+        data._cursor.execute("EXPLAIN QUERY PLAN SELECT value from kvstore where key = ?", ("key1",))
+        assert "kvstore_key" in str(data._cursor.fetchall())
+
+
+def test_sqlite3_files_without_index_migrated():
+    with tempdir():
+        conn = sqlite3.connect("old.sqlite3")
+        conn.execute("CREATE TABLE kvstore (key TEXT, value TEXT)")
+        conn.executemany("INSERT INTO kvstore VALUES (?, ?)", [("a", "1"), ("b", "2"), ("a", "3")])
+        conn.commit()
+        conn.close()
+
+        data = KeyValueData("old.sqlite3")
+        assert data.query_prefix("a") == [("a", "1"), ("a", "3")]
+        assert data.retrieve("b") == "2"
+
+        conn = sqlite3.connect("old.sqlite3")
+        indexes = conn.execute("PRAGMA index_list(kvstore)").fetchall()
+        assert [row[1] for row in indexes] == ["kvstore_key"]
+
+def test_json_key_value_data():
+    with tempdir():
+        data = KeyValueData("data.json")
+        data.append("b", "2")
+        data.append("a", "1")
+        data.append("c", "3")
+        data.save()
+
+        data = KeyValueData("data.json")
+        assert data.query_prefix("") == [("a", "1"), ("b", "2"), ("c", "3")]
+        assert data.query_prefix("b") == [("b", "2")]
+
+def write_rows(filename):
+    data = RowData(filename, headers=["name", "group", "value"])
+    data.SQLITE3_BUFFER_SIZE = 2
+    for i in range(5):
+        data.append("row %s" % i, "odd" if i % 2 else "even", i * 1.5)
+    data.save()
+
+def test_row_data_sqlite3_and_jsonl():
+    with tempdir():
+        for filename in ("data.sqlite3", "data.jsonl"):
+            write_rows(filename)
+
+            data = RowData(filename)
+            assert data.columns() == ["name", "group", "value"]
+            assert len(list(data.rows())) == 5
+            assert list(data.rows())[1] == ("row 1", "odd", 1.5)
+            assert list(data.rows(columns=["value", "name"], where={"group" : "odd"})) == [(1.5, "row 1"), (4.5, "row 3")]
+            assert list(data.rows(where={"group" : "none"})) == []
+
+def test_row_data_sqlite3_copy_readable_after_save():
+    with tempdir():
+        writer = RowData("data.sqlite3", headers=["name", "group", "value"])
+        for i in range(5):
+            writer.append("row %s" % i, "odd" if i % 2 else "even", i * 1.5)
+        writer.save()
+
+        assert not os.path.exists("data.sqlite3-wal")
+        shutil.copy("data.sqlite3", "copy.sqlite3")
+        data = RowData("copy.sqlite3")
+        assert data.columns() == ["name", "group", "value"]
+        assert len(list(data.rows())) == 5
+
+def test_row_data_csv():
+    with tempdir():
+        write_rows("data.csv")
+
+        data = RowData("data.csv")
+        assert data.read().startswith("name,group,value\r\n")
+        assert list(data.rows(columns=["name"], where={"value" : "3.0"})) == [("row 2",)]
+        assert list(data.rows(columns=["name"], where={"value" : 3.0})) == [("row 2",)]
+
+        try:
+            data.rows(columns=["missing"]).next()
+            assert False, "should raise UserFeedback"
+        except UserFeedback:
+            pass
+
+def test_row_data_sqlite3_and_jsonl_need_headers():
+    with tempdir():
+        for filename in ("data.sqlite3", "data.jsonl"):
+            try:
+                RowData(filename)
+                assert False, "should raise UserFeedback"
+            except UserFeedback:
+                pass
+            assert not os.path.exists(filename)
+
+def test_row_data_csv_without_headers():
+    with tempdir():
+        data = RowData("data.csv")
+        data.append("row 0", 0)
+        data.append("row 1", 1)
+        data.save()
+
+        data = RowData("data.csv", headers=["name", "value"])
+        assert data.columns() == ["name", "value"]
+        assert list(data.rows(columns=["name"])) == [("row 0",), ("row 1",)]
+
+        open("empty.csv", "w").close()
+        data = RowData("empty.csv")
+        try:
+            data.rows().next()
+            assert False, "should raise UserFeedback"
+        except UserFeedback:
+            pass
+
+def write_columns(filename):
+    data = ColumnData(filename, headers=["n", "t"], typecodes=["l", "d"])
+    for i in range(10):
+        data.append(i, i * 0.5)
+    data.extend("t", [100.0])
+    data.save()
+
+def test_column_data():
+    with tempdir():
+        write_columns("data.columns")
+
+        data = ColumnData("data.columns")
+        assert data.columns() == ["n", "t"]
+        n = data.column("n")
+        t = data.column("t")
+        assert isinstance(n.buf, mmap.mmap)
+        assert n.offset % 64 == 0 and t.offset % 64 == 0
+        assert len(n) == 10
+        assert len(t) == 11
+        assert list(n) == range(10)
+        assert n[3] == 3
+        assert n[-1] == 9
+        assert t[10] == 100.0
+        assert n[2:5] == array.array("l", [2, 3, 4])
+        assert n[::4] == array.array("l", [0, 4, 8])
+        assert n[5:2] == array.array("l")
+        assert sum(t) == 122.5
+
+        try:
+            n[10]
+            assert False, "should raise IndexError"
+        except IndexError:
+            pass
+
+def test_columns_byte_order():
+    with tempdir():
+        write_columns("data.columns")
+        text = open("data.columns", "rb").read()
+        columns = Columns(text)
+        assert columns["n"].array() == array.array("l", range(10))
+
+        other_byteorder = {'little' : 'big', 'big' : 'little'}[sys.byteorder]
+        columns = Columns(text.replace(sys.byteorder, other_byteorder))
+        swapped = array.array("l", range(10))
+        swapped.byteswap()
+        assert columns["n"].array() == swapped
+
+def test_columns_in_templates():
+    with tempdir():
+        write_columns("data.columns")
+        doc = Doc("report.txt|jinja", Doc("data.columns"), contents="{{ columns(d['data.columns'])['t']|sum }} {{ columns(d['data.columns'])['n']|length }}")
+        runner = Runner(RunParams(mmap_threshold=0), [doc])
+        runner.run()
+        assert doc.output().data() == "122.5 10"
+
+def test_columns_in_templates_use_memory_map():
+    with tempdir():
+        write_columns("data.columns")
+        contents = "{% set n = columns(d['data.columns'])['n'] %}{{ n.buf.__class__.__name__ }} {{ n[2:5]|list }} {{ n[-1] }}"
+        doc = Doc("report.txt|jinja", Doc("data.columns"), contents=contents)
+        runner = Runner(RunParams(mmap_threshold=10), [doc])
+        runner.run()
+        assert doc.output().data() == "mmap [2, 3, 4] 9"
+
+def test_columns_numpy_in_templates():
+    try:
+        import numpy
+    except ImportError:
+        raise SkipTest
+
+    with tempdir():
+        write_columns("data.columns")
+        contents = "{{ columns(d['data.columns'])['t'].numpy()[2:4]|list }}"
+        doc = Doc("report.txt|jinja", Doc("data.columns"), contents=contents)
+        runner = Runner(RunParams(mmap_threshold=10), [doc])
+        runner.run()
+        assert doc.output().data() == "[1.0, 1.5]"
+
+def test_column_data_errors():
+    with tempdir():
+        for args in (("data.csv", ["a"]), ("data.columns", None)):
+            try:
+                ColumnData(*args)
+                assert False, "should raise UserFeedback"
+            except UserFeedback:
+                pass
+
+        try:
+            Columns("not columns")
+            assert False, "should raise UserFeedback"
+        except UserFeedback:
+            pass
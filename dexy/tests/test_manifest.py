@@ -0,0 +1,122 @@
+from dexy.doc import Doc
+from dexy.manifest import Manifest
+from dexy.manifest import json_default
+from dexy.params import RunParams
+from dexy.runner import Runner
+from dexy.tests.utils import tempdir
+import json
+import os
+
+def run(args):
+    runner = Runner(RunParams(), args)
+    runner.run()
+    return runner
+
+def test_unchanged_docs_restored():
+    with tempdir():
+        with open("abc.txt", "w") as f:
+            f.write("these are the contents")
+
+        args = [
+                ["abc.txt|dexy|processtext", {}],
+                ["def.txt|processtext", {"contents" : "more contents"}]
+                ]
+
+        runner1 = run(args)
+        assert os.path.exists(runner1.params.manifest_file)
+        assert not any(a.manifest_entry for a in runner1.docs[0].artifacts)
+
+        runner2 = run(args)
+        for doc1, doc2 in zip(runner1.docs, runner2.docs):
+            for a1, a2 in zip(doc1.artifacts, doc2.artifacts):
+                assert a2.manifest_entry
+                assert a1.hashstring == a2.hashstring
+                assert a1.ext == a2.ext
+            assert doc1.output().data() == doc2.output().data()
+
+        assert runner2.docs[0].final_artifact.source == 'cached'
+
+def test_changed_docs_not_restored():
+    with tempdir():
+        with open("abc.txt", "w") as f:
+            f.write("these are the contents")
+
+        run([["abc.txt|processtext", {}], ["def.txt|processtext", {"contents" : "abc"}]])
+
+        os.utime("abc.txt", (0, 0))
+        runner = run([["abc.txt|processtext", {}], ["def.txt|processtext", {"contents" : "def"}]])
+
+        for doc in runner.docs:
+            assert not doc.final_artifact.manifest_entry
+
+        # Contents of abc.txt are unchanged, so its output is still cached.
+        assert runner.docs[0].final_artifact.source == 'cached'
+        assert runner.docs[1].final_artifact.source == 'generated'
+
+def test_parent_of_changed_doc_not_restored():
+    with tempdir():
+        for contents in ("child", "child", "changed child"):
+            child = Doc("child.txt|processtext", contents=contents)
+            parent = Doc("parent.txt|processtext", child, contents="parent")
+            runner = run([parent])
+
+        assert not child.final_artifact.manifest_entry
+        assert not parent.final_artifact.manifest_entry
+        assert runner.manifest.entries.has_key("parent.txt|processtext")
+
+def test_docs_which_add_docs_not_recorded():
+    with tempdir():
+        args = [["hello.txt|newdoc", {"contents" : "hello"}]]
+        run(args)
+        runner = run(args)
+
+        assert not runner.manifest.entries.has_key("hello.txt|newdoc")
+        assert not runner.docs[0].final_artifact.manifest_entry
+        assert len(runner.registered_docs()) == 2
+
+def test_missing_artifacts_not_restored():
+    with tempdir():
+        args = [["abc.txt|processtext", {"contents" : "abc"}]]
+        runner1 = run(args)
+
+        os.remove(runner1.docs[0].output().storage.data_file())
+
+        runner2 = run(args)
+        assert not runner2.docs[0].final_artifact.manifest_entry
+        assert runner2.docs[0].output().data() == "Dexy processed the text 'abc'"
+
+def test_intermediate_missing_artifacts_not_restored():
+    with tempdir():
+        args = [["abc.txt|processtext|dexy", {"contents" : "abc"}]]
+        runner1 = run(args)
+
+        os.remove(runner1.docs[0].artifacts[1].output_data.storage.data_file())
+
+        runner2 = run(args)
+        assert not runner2.docs[0].final_artifact.manifest_entry
+
+def post_process(text):
+    return text
+
+def setup_runner(args):
+    runner = Runner(RunParams(), args)
+    runner.setup_dexy_dirs()
+    runner.setup_log()
+    runner.setup_store_index()
+    runner.setup_db()
+    runner.setup_docs()
+    runner.setup_graph()
+    return runner
+
+def test_function_args_digest_is_stable():
+    assert not "0x" in json.dumps({'post' : post_process}, default=json_default)
+
+    with tempdir():
+        digests = []
+        for i in range(2):
+            doc = Doc("abc.txt|processtext", contents="abc", post=post_process)
+            runner = setup_runner([doc])
+            digests.append(Manifest(runner).doc_digest(doc))
+
+        assert digests[0]
+        assert digests[0] == digests[1]
@@ -0,0 +1,73 @@
+from dexy.metadata import Metadata
+from dexy.metadata import Md5
+from dexy.params import RunParams
+from dexy.runner import Runner
+from dexy.tests.utils import tempdir
+from ordereddict import OrderedDict
+import hashlib
+
+def test_dict_order_does_not_matter():
+    m1 = Md5()
+    m1.args = {'a' : 1, 'b' : {'c' : 2, 'd' : [3, 4]}}
+    m1.key = "abc.txt"
+
+    m2 = Md5()
+    m2.key = "abc.txt"
+    m2.args = dict(reversed(m1.args.items()))
+
+    assert m1.compute_hash() == m2.compute_hash()
+
+def test_ordered_dict_order_matters():
+    od1 = OrderedDict()
+    od1['1'] = "one"
+    od1['2'] = "two"
+
+    od2 = OrderedDict()
+    od2['2'] = "two"
+    od2['1'] = "one"
+
+    m1 = Md5()
+    m1.contents = od1
+    m2 = Md5()
+    m2.contents = od2
+
+    assert m1.compute_hash() != m2.compute_hash()
+
+def test_values_serialized_unambiguously():
+    m1 = Md5()
+    m1.a = "1"
+    m2 = Md5()
+    m2.a = 1
+    m3 = Md5()
+    m3.a = ["1"]
+    assert len(set([m1.compute_hash(), m2.compute_hash(), m3.compute_hash()])) == 3
+
+def test_md5_hash():
+    m = Md5()
+    m.key = "abc.txt"
+    assert m.compute_hash() == hashlib.md5(m.get_string_for_hash()).hexdigest()
+
+def test_all_hash_functions():
+    for alias, metadata_class in Metadata.aliases.iteritems():
+        if not metadata_class.is_active():
+            continue
+        m1 = metadata_class()
+        m1.key = "abc.txt"
+        m2 = metadata_class()
+        m2.key = "def.txt"
+        assert m1.compute_hash() == m1.compute_hash()
+        assert m1.compute_hash() != m2.compute_hash()
+
+def test_hash_function_param():
+    for alias, length in (('sha1', 40), ('crc32', 8), ('blake2b', 32)):
+        if not Metadata.aliases[alias].is_active():
+            continue
+
+        with tempdir():
+            runner = Runner(RunParams(hashfunction=alias), [["abc.txt|processtext", {"contents" : "abc"}]])
+            runner.run()
+
+            for artifact in runner.docs[0].artifacts:
+                assert artifact.metadata.__class__ == Metadata.aliases[alias]
+                assert len(artifact.hashstring) == length
+            assert runner.docs[0].output().data() == "Dexy processed the text 'abc'"
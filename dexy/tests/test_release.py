@@ -0,0 +1,65 @@
+from dexy.params import RunParams
+from dexy.release import ReleaseTracker
+from dexy.runner import Runner
+from dexy.tests.utils import tempdir
+
+class FakeData(object):
+    def __init__(self, data):
+        self._data = data
+
+    def clear_data(self):
+        self._data = None
+
+class FakeArtifact(object):
+    def __init__(self, data):
+        self.output_data = FakeData(data)
+
+def test_released_after_last_consumer():
+    tracker = ReleaseTracker()
+    a, b, c = [FakeArtifact("x" * 10) for i in range(3)]
+    tracker.add_consumer(a, [])
+    tracker.add_consumer(b, [a])
+    tracker.add_consumer(c, [a, b])
+
+    tracker.completed(a)
+    assert a.output_data._data
+    assert tracker.held_size == 10
+
+    tracker.completed(b)
+    assert a.output_data._data
+    assert b.output_data._data
+
+    tracker.completed(c)
+    assert a.output_data._data is None
+    assert b.output_data._data is None
+    assert c.output_data._data is None
+    assert tracker.held_size == 0
+
+def test_memory_ceiling():
+    tracker = ReleaseTracker(15)
+    a, b, c = [FakeArtifact("x" * 10) for i in range(3)]
+    tracker.add_consumer(a, [])
+    tracker.add_consumer(b, [])
+    tracker.add_consumer(c, [a, b])
+
+    tracker.completed(a)
+    assert a.output_data._data
+
+    tracker.completed(b)
+    assert a.output_data._data is None
+    assert b.output_data._data
+    assert tracker.held_size == 10
+
+def test_unknown_tasks_not_released():
+    tracker = ReleaseTracker()
+    a = FakeArtifact("abc")
+    tracker.completed(a)
+    assert a.output_data._data == "abc"
+
+def test_released_data_reloaded():
+    with tempdir():
+        runner = Runner(RunParams(), [["abc.txt|processtext|processtext", {"contents" : "hello"}]])
+        runner.run()
+        doc = runner.docs[0]
+        assert all(a.output_data._data is None for a in doc.artifacts)
+        assert doc.output().data() == "Dexy processed the text 'Dexy processed the text 'hello''"
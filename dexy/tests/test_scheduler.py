@@ -0,0 +1,75 @@
+from dexy.doc import Doc
+from dexy.exceptions import *
+from dexy.params import RunParams
+from dexy.runner import Runner
+from dexy.scheduler import Scheduler
+from dexy.task import Task
+from dexy.tests.utils import tempdir
+from dexy.tests.utils import temprun
+from nose.tools import raises
+import threading
+
+class RecordingTask(Task):
+    LOCK = threading.Lock()
+
+    def run(self, *args, **kw):
+        with self.LOCK:
+            self.runner.ran.append(self.key)
+
+def test_children_run_before_parents():
+    with temprun() as runner:
+        runner.ran = []
+        t1 = RecordingTask("1", runner=runner)
+        t2 = RecordingTask("2", t1, runner=runner)
+        t3 = RecordingTask("3", t1, runner=runner)
+        t4 = RecordingTask("4", t2, t3, runner=runner)
+
+        Scheduler(runner, 4).run(t4)
+
+        assert sorted(runner.ran) == ['1', '2', '3', '4']
+        assert runner.ran[0] == '1'
+        assert runner.ran[-1] == '4'
+        assert t4.state == 'complete'
+        assert t1 in t4.completed_children.values()
+        assert t1 in t2.completed_children.values()
+
+@raises(CircularDependency)
+def test_circular():
+    with temprun() as runner:
+        runner.ran = []
+        t1 = RecordingTask("1", runner=runner)
+        t2 = RecordingTask("2", runner=runner)
+        t1.children.append(t2)
+        t2.children.append(t1)
+
+        Scheduler(runner, 2).run(t1)
+
+def test_parallel_run_matches_serial_run():
+    args = [["doc%s.txt|outputabc|processtext" % i, {"contents" : "contents %s" % i}] for i in range(10)]
+
+    with tempdir():
+        serial = Runner(RunParams(), args)
+        serial.run()
+        serial_output = [doc.output().data() for doc in serial.docs]
+
+    with tempdir():
+        parallel = Runner(RunParams(workers=4), args)
+        parallel.run()
+        parallel_output = [doc.output().data() for doc in parallel.docs]
+
+    for s, p in zip(serial.docs, parallel.docs):
+        assert p.state == 'complete'
+        assert s.final_artifact.hashstring == p.final_artifact.hashstring
+    assert serial_output == parallel_output
+
+def test_parallel_run_with_added_docs():
+    with tempdir():
+        args = [["hello.txt|newdoc", {"contents" : "hello"}]]
+        runner = Runner(RunParams(workers=2), args)
+        runner.run()
+
+        keys = [doc.key for doc in runner.registered_docs()]
+        assert keys == ["hello.txt|newdoc", "newfile.txt|processtext"]
+
+        doc = runner.docs[0]
+        assert "Doc:newfile.txt|processtext" in doc.completed_children
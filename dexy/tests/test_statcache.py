@@ -0,0 +1,54 @@
+from dexy.params import RunParams
+from dexy.runner import Runner
+from dexy.statcache import StatCache
+from dexy.tests.utils import tempdir
+import hashlib
+import os
+
+def test_fingerprint_is_content_hash():
+    with tempdir():
+        with open("abc.txt", "w") as f:
+            f.write("abc" * 100000)
+
+        cache = StatCache(None)
+        assert cache.fingerprint("abc.txt") == hashlib.md5("abc" * 100000).hexdigest()
+
+def test_unchanged_files_not_reread():
+    with tempdir():
+        with open("abc.txt", "w") as f:
+            f.write("abc")
+
+        cache = StatCache("statcache.json")
+        fingerprint = cache.fingerprint("abc.txt")
+        cache.save()
+
+        cache = StatCache("statcache.json")
+        cache.compute_fingerprint = None # would fail if called
+        assert cache.fingerprint("abc.txt") == fingerprint
+
+def test_changed_files_reread():
+    with tempdir():
+        with open("abc.txt", "w") as f:
+            f.write("abc")
+
+        cache = StatCache("statcache.json")
+        fingerprint = cache.fingerprint("abc.txt")
+
+        with open("abc.txt", "w") as f:
+            f.write("def")
+        os.utime("abc.txt", (0, 0))
+
+        assert cache.fingerprint("abc.txt") != fingerprint
+        assert cache.fingerprint("abc.txt") == hashlib.md5("def").hexdigest()
+
+def test_runner_saves_stat_cache():
+    with tempdir():
+        with open("abc.txt", "w") as f:
+            f.write("abc")
+
+        runner = Runner(RunParams(), [["abc.txt", {}]])
+        runner.run()
+
+        cache = StatCache(runner.params.stat_cache_file)
+        cache.load()
+        assert cache.entries.keys() == ["abc.txt"]
@@ -0,0 +1,290 @@
+from dexy.data import GenericData
+from dexy.datacache import DataCache
+from dexy.exceptions import UserFeedback
+from dexy.params import RunParams
+from dexy.plugins.output_reporters import OutputReporter
+from dexy.runner import Runner
+from dexy.storage import CompressedStorage
+from dexy.storage import GenericStorage
+from dexy.storage import JsonOrderedStorage
+from dexy.storage import SectionsStorage
+from dexy.storage import Sqlite3Storage
+from dexy.storage import materialize
+from dexy.storage import migrate_flat_layout
+from dexy.tests.utils import tempdir
+from dexy.tests.utils import temprun
+from ordereddict import OrderedDict
+import json
+import os
+import stat
+
+def test_data_file_sharded():
+    with temprun() as runner:
+        storage = GenericStorage("abcdef0123456789", ".txt", runner)
+        assert not storage.data_file_exists()
+        assert not os.path.exists(os.path.join("artifacts", "ab"))
+
+        assert storage.data_file() == os.path.join("artifacts", "ab", "cd", "abcdef0123456789.txt")
+        storage.write_data("hello")
+        assert storage.data_file_exists()
+        assert storage.read_data() == "hello"
+
+def test_migrate_flat_layout():
+    with temprun() as runner:
+        with open(os.path.join("artifacts", "abcdef0123456789.txt"), "w") as f:
+            f.write("hello")
+        os.mkdir(os.path.join("artifacts", "abcdef0123456789"))
+
+        assert migrate_flat_layout(runner.params.artifacts_dir, runner.params.work_dir) == 2
+
+        storage = GenericStorage("abcdef0123456789", ".txt", runner)
+        assert storage.read_data() == "hello"
+        assert os.path.isdir(os.path.join("artifacts", "work", "ab", "cd", "abcdef0123456789"))
+        assert os.path.exists(runner.params.db_file)
+        assert not os.path.exists(os.path.join("artifacts", "abcdef0123456789.txt"))
+        assert not os.path.exists(os.path.join("artifacts", "abcdef0123456789"))
+
+def write_source(contents="hello"):
+    with open("source.txt", "w") as f:
+        f.write(contents)
+
+def test_materialize_copy():
+    with tempdir():
+        write_source()
+        assert materialize("source.txt", "dest.txt") == 'copy'
+        assert os.stat("source.txt").st_ino != os.stat("dest.txt").st_ino
+        assert open("dest.txt").read() == "hello"
+
+def test_materialize_hardlink():
+    with tempdir():
+        write_source()
+        with open("dest.txt", "w") as f:
+            f.write("existing file is replaced")
+
+        assert materialize("source.txt", "dest.txt", 'hardlink') == 'hardlink'
+        assert os.stat("source.txt").st_ino == os.stat("dest.txt").st_ino
+        assert not os.stat("source.txt").st_mode & stat.S_IWUSR
+
+def test_materialize_symlink():
+    with tempdir():
+        write_source()
+        assert materialize("source.txt", "dest.txt", 'symlink') == 'symlink'
+        assert os.path.islink("dest.txt")
+        assert open("dest.txt").read() == "hello"
+        assert not os.stat("source.txt").st_mode & stat.S_IWUSR
+
+def test_materialize_reflink_falls_back_to_copy():
+    with tempdir():
+        write_source()
+        assert materialize("source.txt", "dest.txt", 'reflink') in ('reflink', 'copy')
+        assert open("dest.txt").read() == "hello"
+        assert os.stat("source.txt").st_mode & stat.S_IWUSR
+
+def test_materialize_invalid_strategy():
+    with tempdir():
+        write_source()
+        try:
+            materialize("source.txt", "dest.txt", 'teleport')
+            assert False
+        except UserFeedback as e:
+            assert "teleport" in e.message
+
+def test_output_reporter_links_to_cache():
+    with tempdir():
+        runner = Runner(RunParams(materialize='hardlink'), [["abc.txt|processtext", {"contents" : "abc"}]])
+        runner.run()
+        OutputReporter().run(runner)
+
+        data_file = runner.docs[0].output().storage.data_file()
+        assert os.stat(data_file).st_ino == os.stat(os.path.join("output", "abc.txt")).st_ino
+
+def test_source_files_not_linked():
+    with tempdir():
+        write_source()
+        runner = Runner(RunParams(materialize='hardlink'), [["source.txt", {}]])
+        runner.run()
+
+        data_file = runner.docs[0].output().storage.data_file()
+        assert os.stat(data_file).st_ino != os.stat("source.txt").st_ino
+        assert os.stat("source.txt").st_mode & stat.S_IWUSR
+
+def interrupted_stream(items):
+    for item in items:
+        yield item
+    raise KeyboardInterrupt
+
+def test_interrupted_write_leaves_no_partial_file():
+    with temprun() as runner:
+        streams = [
+                (GenericStorage, ".txt", ["a" * 100, "b" * 100]),
+                (CompressedStorage, ".txt", ["a" * 100, "b" * 100]),
+                (SectionsStorage, ".json", [("1", "a"), ("2", "b")])
+                ]
+        for storage_class, ext, items in streams:
+            storage = storage_class("abcdef0123456789", ext, runner)
+            try:
+                storage.write_stream(interrupted_stream(items))
+                assert False, "should raise KeyboardInterrupt"
+            except KeyboardInterrupt:
+                pass
+            assert not storage.data_file_exists()
+            assert os.listdir(os.path.dirname(storage.data_path())) == []
+
+def test_interrupted_write_keeps_previous_data():
+    with temprun() as runner:
+        storage = GenericStorage("abcdef0123456789", ".txt", runner)
+        storage.write_data("hello")
+        try:
+            storage.write_stream(interrupted_stream(["goodbye"]))
+        except KeyboardInterrupt:
+            pass
+        assert storage.read_data() == "hello"
+
+def test_open_for_writing():
+    with temprun() as runner:
+        storage = GenericStorage("abcdef0123456789", ".txt", runner)
+        with storage.open_for_writing() as f:
+            f.write("hello")
+            assert not storage.data_file_exists()
+        assert storage.read_data() == "hello"
+
+        storage = CompressedStorage("0123456789abcdef", ".txt", runner)
+        with storage.open_for_writing() as f:
+            f.write("hello")
+        assert storage.is_compressed()
+        assert storage.read_data() == "hello"
+
+def test_compressed_storage():
+    with temprun() as runner:
+        storage = CompressedStorage("abcdef0123456789", ".txt", runner)
+        text = "hello compressed world\n" * 1000
+        storage.write_data(text)
+
+        assert storage.is_compressed()
+        assert not os.path.exists(storage.data_path())
+        assert os.path.getsize(storage.compressed_path()) < len(text) / 10
+        assert storage.data_file_exists()
+        assert storage.read_data() == text
+
+        storage.write_data(None, "output.txt")
+        assert open("output.txt", "rb").read() == text
+
+def test_compressed_storage_policy():
+    with temprun() as runner:
+        small_text = CompressedStorage("abcdef0123456789", ".txt", runner)
+        small_text.write_data("hello")
+        assert not small_text.is_compressed()
+        assert small_text.read_data() == "hello"
+
+        large_binary = CompressedStorage("0123456789abcdef", ".png", runner)
+        large_binary.write_data("x" * 10000)
+        assert not large_binary.is_compressed()
+        assert large_binary.read_data() == "x" * 10000
+
+def test_compressed_storage_policy_params():
+    with tempdir():
+        runner = Runner(RunParams(compress_extensions=['.png'], compress_min_size=10))
+        small_text = CompressedStorage("abcdef0123456789", ".txt", runner)
+        small_text.write_data("x" * 100)
+        assert not small_text.is_compressed()
+
+        binary = CompressedStorage("0123456789abcdef", ".png", runner)
+        binary.write_data("x" * 100)
+        assert binary.is_compressed()
+        assert binary.read_data() == "x" * 100
+
+def test_compressed_output_decompressed_to_file():
+    with tempdir():
+        runner = Runner(RunParams(storage_types={'generic' : 'compressed'}))
+        data = GenericData("abcdef0123456789", ".txt", runner)
+        data.set_data("hello compressed world\n" * 100)
+        data.clear_data()
+        assert data.storage.is_compressed()
+
+        runner.data_cache = DataCache(10000)
+        data.output_to_file("output.txt")
+
+        assert open("output.txt", "rb").read() == "hello compressed world\n" * 100
+        assert data._data is None
+        assert not runner.data_cache.entries
+
+def test_compressed_data_in_run():
+    with tempdir():
+        with open("abc.txt", "w") as f:
+            f.write("abc\n" * 1000)
+
+        params = RunParams(storage_types={'generic' : 'compressed'})
+        runner = Runner(params, [["abc.txt|head", {}]])
+        runner.run()
+        OutputReporter().run(runner)
+
+        for artifact in runner.docs[0].artifacts:
+            assert artifact.output_data.storage.is_compressed()
+        assert runner.docs[0].output().data() == "abc\n" * 10
+        assert open(os.path.join("output", "abc.txt")).read() == "abc\n" * 10
+
+        runner = Runner(params, [["abc.txt|head", {}]])
+        runner.run()
+        assert runner.docs[0].final_artifact.source == 'cached'
+
+def test_sections_storage():
+    with temprun() as runner:
+        data = OrderedDict()
+        for k in ("zzz", "aaa", "mmm"):
+            data[k] = "contents of %s\nwith \"quotes\"" % k
+
+        storage = SectionsStorage("abcdef0123456789", ".txt", runner)
+        storage.write_data(data)
+
+        assert storage.read_data() == data
+        assert storage.read_keys() == ["zzz", "aaa", "mmm"]
+        assert storage.read_section("aaa") == data["aaa"]
+        try:
+            storage.read_section("bbb")
+            assert False
+        except KeyError:
+            pass
+
+def test_sections_storage_has_no_size_limit():
+    with temprun() as runner:
+        n = SectionsStorage.MAX_DATA_DICT_LENGTH + 1
+        storage = SectionsStorage("abcdef0123456789", ".txt", runner)
+        storage.write_stream(("%s" % i, "line %s" % i) for i in xrange(n))
+
+        assert storage.read_section("%s" % (n - 1)) == "line %s" % (n - 1)
+        assert len(storage.read_data()) == n
+
+def test_sections_storage_reads_json_ordered_files():
+    with temprun() as runner:
+        data = OrderedDict()
+        data["b"] = "first"
+        data["a"] = "second"
+        JsonOrderedStorage("abcdef0123456789", ".txt", runner).write_data(data)
+
+        storage = SectionsStorage("abcdef0123456789", ".txt", runner)
+        assert storage.read_data() == data
+        assert storage.read_keys() == ["b", "a"]
+        assert storage.read_section("a") == "second"
+
+def test_sqlite3_storage():
+    with temprun() as runner:
+        storage = Sqlite3Storage("abcdef0123456789", ".json", runner)
+        storage.write_data({"mod.a:doc" : "A", "mod.b:doc" : None, "other:doc" : [1, 2]})
+
+        assert storage.data_path().endswith("abcdef0123456789.json.sqlite3")
+        assert storage.data_file_exists()
+        assert storage.read_value("mod.b:doc") is None
+        assert storage.read_value("other:doc") == [1, 2]
+        assert storage.read_keys() == ["mod.a:doc", "mod.b:doc", "other:doc"]
+        assert storage.read_prefix("mod.").items() == [("mod.a:doc", "A"), ("mod.b:doc", None)]
+        assert storage.read_prefix("").keys() == storage.read_keys()
+        assert storage.read_data()["mod.a:doc"] == "A"
+
+        try:
+            storage.read_value("missing")
+            assert False, "should raise KeyError"
+        except KeyError:
+            pass
+
+        storage.write_data(storage.read_data(), "output.json")
+        assert json.load(open("output.json"))["other:doc"] == [1, 2]
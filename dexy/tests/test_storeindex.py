@@ -0,0 +1,70 @@
+from dexy.params import RunParams
+from dexy.runner import Runner
+from dexy.storage import GenericStorage
+from dexy.storeindex import StoreIndex
+from dexy.tests.utils import tempdir
+from dexy.tests.utils import temprun
+import dexy.storage
+import os
+
+def test_scan():
+    with temprun() as runner:
+        storage = GenericStorage("abcdef0123456789", ".txt", runner)
+        storage.write_data("hello")
+        with open(dexy.storage.temp_path(storage.data_path()), "w") as f:
+            f.write("partly written")
+        with open(os.path.join("artifacts", "abcdef0123456789.txt"), "w") as f:
+            f.write("flat layout")
+
+        index = StoreIndex(runner.params.artifacts_dir)
+        index.load()
+        assert index.filepaths == set([storage.data_path()])
+        assert index.dirs == set([os.path.dirname(storage.data_path())])
+
+def test_missing_artifacts_dir():
+    with tempdir():
+        index = StoreIndex("artifacts")
+        assert not index.exists(os.path.join("artifacts", "ab", "cd", "abcdef0123456789.txt"))
+        assert not index.has_dir(os.path.join("artifacts", "ab", "cd"))
+
+def test_existence_answered_from_index():
+    with temprun() as runner:
+        storage = GenericStorage("abcdef0123456789", ".txt", runner)
+        storage.write_data("hello")
+        assert storage.data_file_exists()
+
+        os.remove(storage.data_path())
+        assert storage.data_file_exists()
+
+        runner.store_index.load()
+        assert not storage.data_file_exists()
+
+def test_file_written_directly_indexed():
+    with temprun() as runner:
+        storage = GenericStorage("abcdef0123456789", ".txt", runner)
+        with open(storage.data_file(), "wb") as f:
+            f.write("hello")
+        assert not storage.data_file_exists()
+
+        storage.index_data_file()
+        assert storage.data_file_exists()
+
+def test_cached_in_next_run():
+    with tempdir():
+        args = [["abc.txt|processtext|processmanual", {"contents" : "hello"}]]
+        Runner(RunParams(), args).run()
+
+        runner = Runner(RunParams(), args)
+        runner.run()
+        assert all(a.source == 'cached' for a in runner.docs[0].artifacts[1:])
+        assert len(runner.store_index.filepaths) == 3
+
+def test_files_outside_store_not_indexed():
+    with temprun() as runner:
+        storage = GenericStorage("abcdef0123456789", ".txt", runner)
+        storage.write_data("hello")
+        os.mkdir("output")
+        storage.write_data(None, os.path.join("output", "hello.txt"))
+        storage.write_stream(["hello"], "hello.txt")
+
+        assert runner.store_index.filepaths == set([storage.data_path()])